@@ -0,0 +1,151 @@
+import json
+import struct
+
+import numpy as np
+
+import snapshot
+
+# compact binary format of a single day, written next to <date>.json
+#
+# header   '<4sHHiII'  magic, version, section count, precision,
+#                      unit count ru, unit count ua
+# sections '<4sII'     tag, byte offset, byte length (one entry per section)
+#
+# RUID / UAID  int32[n]       unit ids
+# RUXY / UAXY  int32[n, 2]    unit lon, lat
+# FLOF / AROF / AUOF  int32[m + 1]   point offsets of each frontline
+#                                    line / area / ua area
+# FLXY / ARXY / AUXY  int32[p, 2]    lat, lon of all points
+# GEOS         utf-8 json     geolocations of the day
+#
+# coordinates are quantized: int = round(value * 10 ** precision),
+# which has to fit into int32, so a precision of 7 at most for lon, lat.
+# all sections start 8-byte aligned, so the reader can map them
+# with numpy.frombuffer without copying
+
+MAGIC = b'OMTL'
+VERSION = 1
+HEADER = struct.Struct('<4sHHiII')
+SECTION = struct.Struct('<4sII')
+DTYPE = np.dtype('<i4')
+INT32 = np.iinfo(DTYPE)
+
+UNIT_SECTIONS = {
+    'ru': (b'RUID', b'RUXY'),
+    'ua': (b'UAID', b'UAXY')
+}
+GEOMETRY_SECTIONS = {
+    'frontline': (b'FLOF', b'FLXY'),
+    'areas': (b'AROF', b'ARXY'),
+    'areas_ua': (b'AUOF', b'AUXY')
+}
+
+
+def _quantize(coords, scale):
+    coords = np.round(np.asarray(coords, dtype=np.float64).reshape(-1, 2) * scale)
+    # astype would wrap around silently
+    if coords.size and not (INT32.min <= coords.min() and coords.max() <= INT32.max):
+        raise ValueError(f'coordinates out of the int32 range at scale {scale}')
+    return coords.astype(DTYPE)
+
+
+def _geometries(geometries, scale):
+    # list of (n, 2) geometries -> offsets, flat points
+    if isinstance(geometries, snapshot.Rings):
+        return (geometries.offsets.astype(DTYPE), _quantize(geometries.coords, scale))
+    arrays = [_quantize(geometry, scale) for geometry in geometries]
+    offsets = np.zeros(len(arrays) + 1, dtype=DTYPE)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    points = np.concatenate(arrays) if arrays else np.empty((0, 2), dtype=DTYPE)
+    return (offsets, points)
+
+
+def dumps(day, precision=7):
+    if precision < 0 or 180 * 10 ** precision > INT32.max:
+        raise ValueError(f'precision {precision} does not fit into int32')
+    scale = 10 ** precision
+    sections = []
+    if isinstance(day, snapshot.Snapshot):
+        units_by_side = day.units_by_side
+    else:
+        units_by_side = {side: ([unit_id for (unit_id, _) in units], [lonlat for (_, lonlat) in units])
+                         for (side, units) in day['units'].items()}
+    for (side, (id_tag, xy_tag)) in UNIT_SECTIONS.items():
+        (ids, lonlat) = units_by_side.get(side, ([], []))
+        ids = np.asarray(ids, dtype=DTYPE)
+        lonlat = _quantize(lonlat, scale)
+        sections.append((id_tag, ids.tobytes()))
+        sections.append((xy_tag, lonlat.tobytes()))
+    for (key, (offset_tag, xy_tag)) in GEOMETRY_SECTIONS.items():
+        (offsets, points) = _geometries(day.get(key, []), scale)
+        sections.append((offset_tag, offsets.tobytes()))
+        sections.append((xy_tag, points.tobytes()))
+    geos = json.dumps(day.get('geos', []), sort_keys=True, separators=(',', ':'))
+    sections.append((b'GEOS', geos.encode('utf-8')))
+
+    header = HEADER.pack(MAGIC, VERSION, len(sections), precision,
+                         day['unit_count']['ru'], day['unit_count']['ua'])
+    position = HEADER.size + SECTION.size * len(sections)
+    table = []
+    body = []
+    for (tag, data) in sections:
+        padding = -position % 8
+        body.append(b'\0' * padding)
+        position += padding
+        table.append(SECTION.pack(tag, position, len(data)))
+        body.append(data)
+        position += len(data)
+    return b''.join([header] + table + body)
+
+
+def loads(buf):
+    # zero copy: all arrays are views on buf
+    (magic, version, count, precision, count_ru, count_ua) = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f'not a v{VERSION} binary timeline file')
+    sections = {}
+    for i in range(count):
+        (tag, offset, length) = SECTION.unpack_from(buf, HEADER.size + i * SECTION.size)
+        sections[tag] = (offset, length)
+
+    def array(tag, width=1):
+        (offset, length) = sections[tag]
+        a = np.frombuffer(buf, dtype=DTYPE, count=length // DTYPE.itemsize, offset=offset)
+        return a.reshape(-1, width) if width > 1 else a
+
+    frame = {
+        'precision': precision,
+        'unit_count': {
+            'ru': count_ru,
+            'ua': count_ua
+        },
+        'units': {side: (array(id_tag), array(xy_tag, 2))
+                  for (side, (id_tag, xy_tag)) in UNIT_SECTIONS.items()}
+    }
+    (offset, length) = sections[b'GEOS']
+    frame['geos'] = json.loads(bytes(buf[offset:offset + length]))
+    for (key, (offset_tag, xy_tag)) in GEOMETRY_SECTIONS.items():
+        frame[key] = (array(offset_tag), array(xy_tag, 2))
+    return frame
+
+
+def load(file_name):
+    with open(file_name, mode='rb') as f:
+        return loads(f.read())
+
+
+def to_day(frame):
+    # dequantize into the same structure as the json files
+    scale = 10 ** frame['precision']
+    day = {
+        'unit_count': frame['unit_count'],
+        'units': {side: [[int(unit_id), lonlat] for (unit_id, lonlat)
+                         in zip(ids.tolist(), (xy / scale).tolist())]
+                  for (side, (ids, xy)) in frame['units'].items()},
+        'geos': frame['geos']
+    }
+    for key in GEOMETRY_SECTIONS:
+        (offsets, xy) = frame[key]
+        points = (xy / scale).tolist()
+        day[key] = [points[start:end] for (start, end) in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    return day
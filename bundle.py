@@ -0,0 +1,57 @@
+import json
+import os
+from datetime import datetime
+
+import output
+
+# multi-day bundles
+# the daily files of a week or month are concatenated into
+# <bundle_dir>/<key>.bundle, index.json holds the byte offset & length
+# of every day: {key: {date: [offset, length]}}.
+# a client can load a whole range with one request, or single days
+# with http range requests (bytes=offset-(offset + length - 1))
+
+PERIODS = ['week', 'month']
+
+
+def period_key(date_key, period):
+    if period == 'month':
+        return date_key[:6]
+    (year, week, _) = datetime.strptime(date_key, '%Y%m%d').isocalendar()
+    return f'{year}W{week:02d}'
+
+
+def read_index(bundle_dir):
+    try:
+        with open(os.path.join(bundle_dir, 'index.json'), encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def write(day_dir, bundle_dir, dates, changed_dates, period, encodings=()):
+    # rebuilds every bundle which contains one of the changed dates
+    os.makedirs(bundle_dir, exist_ok=True)
+    groups = {}
+    for date_key in dates:
+        groups.setdefault(period_key(date_key, period), []).append(date_key)
+    keys = sorted({period_key(date_key, period) for date_key in changed_dates})
+
+    index = read_index(bundle_dir)
+    for key in keys:
+        parts = []
+        entries = {}
+        offset = 0
+        for date_key in groups.get(key, []):
+            try:
+                with open(os.path.join(day_dir, f'{date_key}.json'), mode='rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            entries[date_key] = [offset, len(data)]
+            parts.append(data)
+            offset += len(data)
+        output.write_bytes(os.path.join(bundle_dir, f'{key}.bundle'), b''.join(parts), encodings)
+        index[key] = entries
+    output.write_json(os.path.join(bundle_dir, 'index.json'), index, encodings)
+    return len(keys)
@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+def git_blob_sha(content):
+    # same hash github reports as 'sha' in the contents api listing
+    header = f'blob {len(content)}\0'.encode()
+    return hashlib.sha1(header + content).hexdigest()
+
+
+class KmzCache:
+
+    # persistent on-disk cache for the kmz backup files
+    # + objects/<sha> holds the file content, keyed by its git blob sha
+    # + index.json maps the upstream path to the object and the http
+    #   validators (etag / last-modified) of the response it came from
+
+    def __init__(self, cache_dir='./tmp/cache', max_size=10 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        self.index_file = os.path.join(cache_dir, 'index.json')
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.index = {}
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._load()
+        self._reconcile()
+
+    def _load(self):
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, encoding='utf-8') as fh:
+                self.index = json.load(fh)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f'ignoring broken cache index: {e}')
+            self.index = {}
+
+    def _reconcile(self):
+        # a run that died before save() leaves objects behind which the
+        # index doesn't know about, and so evict() would never count them.
+        # drop those (and half written temp files), and the entries
+        # whose object is gone
+        on_disk = set(os.listdir(self.objects_dir))
+        self.index = {path: entry for (path, entry) in self.index.items()
+                      if entry['sha'] in on_disk}
+        known = {entry['sha'] for entry in self.index.values()}
+        for name in on_disk - known:
+            os.remove(self._object_file(name))
+        self.evict()
+
+    def _object_file(self, sha):
+        return os.path.join(self.objects_dir, sha)
+
+    def _read_object(self, sha):
+        try:
+            with open(self._object_file(sha), mode='rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get(self, path, sha):
+        # content addressed lookup, the listing already tells us the
+        # sha of the upstream file, so no request is needed on a hit
+        if sha is None:
+            return None
+        content = self._read_object(sha)
+        if content is None:
+            return None
+        with self.lock:
+            entry = self.index.get(path, {})
+            entry.update({'sha': sha, 'size': len(content), 'atime': time.time()})
+            self.index[path] = entry
+        return content
+
+    def validators(self, path):
+        # headers for a conditional request against the upstream file
+        headers = {}
+        with self.lock:
+            entry = self.index.get(path)
+        if entry is None or not os.path.exists(self._object_file(entry['sha'])):
+            return headers
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def read(self, path):
+        # read the cached content after a '304 not modified' response
+        with self.lock:
+            entry = self.index.get(path)
+        if entry is None:
+            return None
+        content = self._read_object(entry['sha'])
+        if content is not None:
+            with self.lock:
+                entry['atime'] = time.time()
+        return content
+
+    def store(self, path, content, etag=None, last_modified=None):
+        sha = git_blob_sha(content)
+        file_name = self._object_file(sha)
+        if not os.path.exists(file_name):
+            # write to a temp file first, so a crash never leaves
+            # a truncated object behind
+            tmp_file_name = f'{file_name}.{threading.get_ident()}.tmp'
+            with open(tmp_file_name, mode='wb') as f:
+                f.write(content)
+            os.replace(tmp_file_name, file_name)
+        with self.lock:
+            self.index[path] = {
+                'sha': sha,
+                'size': len(content),
+                'etag': etag,
+                'last_modified': last_modified,
+                'atime': time.time()
+            }
+        self.evict()
+        return sha
+
+    def evict(self):
+        # drop the least recently used objects until we are below max_size
+        with self.lock:
+            objects = {}
+            for entry in self.index.values():
+                atime = max(entry['atime'], objects.get(entry['sha'], (0, 0))[0])
+                objects[entry['sha']] = (atime, entry['size'])
+            total = sum(size for (_, size) in objects.values())
+            if total <= self.max_size:
+                return
+            for (sha, (_, size)) in sorted(objects.items(), key=lambda x: x[1][0]):
+                if total <= self.max_size:
+                    break
+                if os.path.exists(self._object_file(sha)):
+                    os.remove(self._object_file(sha))
+                total -= size
+                self.index = {k: v for k, v in self.index.items() if v['sha'] != sha}
+
+    def save(self):
+        with self.lock:
+            tmp_file_name = f'{self.index_file}.tmp'
+            with open(tmp_file_name, 'w', encoding='utf-8') as fh:
+                json.dump(self.index, fh, sort_keys=True, separators=(',', ':'))
+            os.replace(tmp_file_name, self.index_file)
@@ -1,7 +1,51 @@
 from http.server import HTTPServer, SimpleHTTPRequestHandler
+import io
+import re
 import sys
 import os
 
+# precompressed siblings written by the generator (see output.py),
+# in order of preference
+ENCODINGS = [
+    ('br', '.br'),
+    ('gzip', '.gz')
+]
+
+
+def accepted_encodings(header):
+    # Accept-Encoding: gzip, br;q=0.5, identity;q=0 -> ({'gzip', 'br'}, {'identity'})
+    # the refused ones (q=0) are returned too, '*' doesn't cover them
+    accepted = set()
+    refused = set()
+    for part in (header or '').split(','):
+        (encoding, _, params) = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            (key, _, value) = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if encoding:
+            (accepted if q > 0 else refused).add(encoding.lower())
+    return (accepted, refused)
+
+
+def parse_range(header, size):
+    # 'bytes=0-99' / 'bytes=100-' / 'bytes=-100' -> (start, end), inclusive
+    # None for anything else (like multiple ranges), then the whole file is sent
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', (header or '').strip())
+    if match is None or match.group(1) == match.group(2) == '':
+        return None
+    if match.group(1) == '':
+        start = max(size - int(match.group(2)), 0)
+        end = size - 1
+    else:
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    return (start, end)
+
 
 class CORSRequestHandler(SimpleHTTPRequestHandler):
 
@@ -17,6 +61,58 @@ class CORSRequestHandler(SimpleHTTPRequestHandler):
         self.send_response(200)
         self.end_headers()
 
+    def send_head(self):
+        # serve a precompressed sibling if the client accepts it,
+        # nothing is compressed at request time
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return super(CORSRequestHandler, self).send_head()
+        if 'Range' in self.headers:
+            return self.send_range(path)
+        (accepted, refused) = accepted_encodings(self.headers.get('Accept-Encoding'))
+        for (encoding, suffix) in ENCODINGS:
+            if encoding in refused or (encoding not in accepted and '*' not in accepted):
+                continue
+            try:
+                f = open(path + suffix, 'rb')
+            except OSError:
+                continue
+            fs = os.fstat(f.fileno())
+            self.send_response(200)
+            self.send_header('Content-Type', self.guess_type(path))
+            self.send_header('Content-Encoding', encoding)
+            self.send_header('Content-Length', str(fs.st_size))
+            self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return f
+        return super(CORSRequestHandler, self).send_head()
+
+    def send_range(self, path):
+        # single byte ranges (e.g. one day of a bundle), always uncompressed
+        with open(path, 'rb') as f:
+            fs = os.fstat(f.fileno())
+            byte_range = parse_range(self.headers.get('Range'), fs.st_size)
+            if byte_range is None:
+                return super(CORSRequestHandler, self).send_head()
+            (start, end) = byte_range
+            if start >= fs.st_size or start > end:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{fs.st_size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return None
+            f.seek(start)
+            data = f.read(end - start + 1)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{end}/{fs.st_size}')
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Last-Modified', self.date_time_string(fs.st_mtime))
+        self.end_headers()
+        return io.BytesIO(data)
+
 
 web_dir = os.path.join(os.path.dirname(__file__), 'data')
 os.chdir(web_dir)
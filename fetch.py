@@ -0,0 +1,99 @@
+import asyncio
+import json
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+# status codes worth another try, everything else >= 400 is final
+RETRY_STATUS = [429, 500, 502, 503, 504]
+
+
+class Response:
+
+    __slots__ = ('status', 'headers', 'content')
+
+    def __init__(self, status, headers, content):
+        self.status = status
+        self.headers = headers
+        self.content = content
+
+
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=60.0):
+    # the server knows best, otherwise exponential backoff with full jitter
+    if retry_after is not None:
+        return min(max(retry_after, 0), cap * 10)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def parse_retry_after(status, headers):
+    value = headers.get('Retry-After')
+    if value is not None:
+        if value.isdigit():
+            return float(value)
+        try:
+            return parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    # github api rate limit (403/429 with an exhausted quota)
+    if status in [403, 429] and headers.get('X-RateLimit-Remaining') == '0':
+        reset = headers.get('X-RateLimit-Reset')
+        if reset is not None and reset.isdigit():
+            return float(reset) - time.time() + 1
+    return None
+
+
+class Fetcher:
+
+    # async download engine
+    # + one pooled session, connections are reused per host
+    # + at most `concurrency` requests in flight
+    # + retries with exponential backoff, jitter and retry-after handling
+
+    def __init__(self, concurrency=8, retries=5, timeout=60):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.timeout = timeout
+        self.semaphore = None
+        self.session = None
+
+    async def __aenter__(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency, limit_per_host=self.concurrency)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+
+    async def request(self, url, headers=None):
+        for attempt in range(self.retries):
+            retry_after = None
+            try:
+                async with self.semaphore:
+                    async with self.session.get(url, headers=headers) as r:
+                        if r.status < 400:
+                            content = await r.read()
+                            return Response(r.status, r.headers, content)
+                        retry_after = parse_retry_after(r.status, r.headers)
+                        if r.status not in RETRY_STATUS and retry_after is None:
+                            print(f'An error occurred: {r.status} {url}')
+                            return None
+                        print(f'{r.status} on {url}, retrying')
+            except asyncio.TimeoutError:
+                print(f'The request timed out: {url}')
+            except aiohttp.ClientError as e:
+                print(f'An error occurred: {e}')
+            if attempt < self.retries - 1:
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+        return None
+
+    async def get_json(self, url):
+        r = await self.request(url, headers={'Accept': 'application/json'})
+        if r is None:
+            return None
+        return json.loads(r.content)
@@ -0,0 +1,54 @@
+import re
+
+import numpy as np
+
+import snapshot
+
+# coordinate helpers
+# geometries are kept as (n, 2) float arrays until they get serialized
+
+
+def parse_coordinates(text):
+    # kml <coordinates> text -> (n, 2|3) array of lon, lat[, alt]
+    # tuples are separated by whitespace, values by commas
+    if text is None:
+        return np.empty((0, 2))
+    latlons = re.sub(r", +", ",", text.strip()).split()
+    if not latlons:
+        return np.empty((0, 2))
+    width = latlons[0].count(',') + 1
+    values = np.fromstring(','.join(latlons), sep=',')
+    if values.size == len(latlons) * width:
+        return values.reshape(-1, width)
+    # tuples of mixed size, keep lon & lat only
+    return np.array([[float(c) for c in latlon.split(',')[:2]] for latlon in latlons])
+
+
+def from_coords(coords):
+    # sequence of coordinate tuples (fastkml/pygeoif) -> (n, 2|3) array
+    return np.asarray(coords, dtype=np.float64)
+
+
+def latlon(coords):
+    # lon, lat[, alt] -> lat, lon (as a view, no copy)
+    return coords[:, 1::-1]
+
+
+def close_ring(coords):
+    # linear rings are self closing
+    if len(coords) > 0 and not np.array_equal(coords[0], coords[-1]):
+        return np.vstack([coords, coords[:1]])
+    return coords
+
+
+def json_default(o):
+    # json.dump hook for numpy values
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    if isinstance(o, snapshot.Rings):
+        return o.tolist()
+    if isinstance(o, snapshot.Snapshot):
+        return o.to_dict()
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
@@ -0,0 +1,62 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import output
+import polyline
+
+# content addressed geometry store
+# every distinct ring / linestring is written once to <store_dir>/<id>.json,
+# the id is a hash of its quantized coordinates. daily files only refer to
+# the ids, so a geometry which does not change for weeks is downloaded once.
+# with polyline_precision > 0 the files hold encoded polyline strings
+
+
+class GeometryStore:
+
+    def __init__(self, store_dir='./data/geometry', precision=7, polyline_precision=0, encodings=()):
+        self.store_dir = store_dir
+        self.precision = precision
+        self.polyline_precision = polyline_precision
+        self.encodings = encodings
+        self.scale = 10 ** precision
+        self.known = set()
+        os.makedirs(store_dir, exist_ok=True)
+
+    def quantize(self, coords):
+        coords = np.asarray(coords, dtype=np.float64)
+        return np.round(coords * self.scale).astype(np.int64)
+
+    def geometry_id(self, quantized):
+        shape = ','.join(str(x) for x in quantized.shape)
+        # the file content depends on the encoding, so does the id
+        if self.polyline_precision > 0:
+            shape = f'{shape};polyline{self.polyline_precision}'
+        return hashlib.sha1(shape.encode() + quantized.tobytes()).hexdigest()[:16]
+
+    def add(self, coords):
+        quantized = self.quantize(coords)
+        geometry_id = self.geometry_id(quantized)
+        if geometry_id in self.known:
+            return geometry_id
+        file_name = os.path.join(self.store_dir, f'{geometry_id}.json')
+        # ids are content addressed, an existing file never changes
+        if not os.path.exists(file_name):
+            tmp_file_name = f'{file_name}.tmp'
+            geometry = quantized / self.scale
+            if self.polyline_precision > 0:
+                geometry = polyline.encode(geometry, self.polyline_precision)
+            else:
+                geometry = geometry.tolist()
+            data = json.dumps(geometry, separators=(',', ':')).encode('utf-8')
+            with open(tmp_file_name, mode='wb') as f:
+                f.write(data)
+            os.replace(tmp_file_name, file_name)
+            output.write_siblings(file_name, data, self.encodings)
+        self.known.add(geometry_id)
+        return geometry_id
+
+    def refs(self, geometries):
+        return [self.add(coords) for coords in geometries]
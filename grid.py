@@ -0,0 +1,70 @@
+import math
+
+import numpy as np
+
+# spatial index of a day: a fixed lon/lat grid over the unit positions and
+# the geolocations. serialized with the day as
+#   'grid': {'size': <cell size in degrees>,
+#            'units': {side: {'<x>_<y>': [index, ...]}},
+#            'geos': {side: {'<x>_<y>': [index, ...]}}}
+# cell x/y count from -180/-90, the indexes point into units[side] and
+# geos[side]. a bounding box query only looks at the cells it overlaps
+
+
+def cell_key(x, y):
+    return f'{x}_{y}'
+
+
+def _cells(points, size):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return {}
+    xy = np.floor((points + [180, 90]) / size).astype(np.int64)
+    cells = {}
+    for (i, (x, y)) in enumerate(xy.tolist()):
+        cells.setdefault(cell_key(x, y), []).append(i)
+    return cells
+
+
+def build(day, size):
+    grid = {
+        'size': size,
+        'units': {},
+        'geos': {}
+    }
+    for (side, units) in day['units'].items():
+        grid['units'][side] = _cells([lonlat for (_, lonlat) in units], size)
+    # geos is an empty list on days without geolocations
+    for (side, geos) in (day.get('geos') or {}).items():
+        grid['geos'][side] = _cells([geo['c'] for geo in geos], size)
+    return grid
+
+
+def _query_cells(cells, items, position, bbox, size):
+    (min_lon, min_lat, max_lon, max_lat) = bbox
+    found = []
+    for x in range(math.floor((min_lon + 180) / size), math.floor((max_lon + 180) / size) + 1):
+        for y in range(math.floor((min_lat + 90) / size), math.floor((max_lat + 90) / size) + 1):
+            for i in cells.get(cell_key(x, y), []):
+                (lon, lat) = position(items[i])
+                if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat:
+                    found.append(i)
+    return [items[i] for i in sorted(found)]
+
+
+def query(day, bbox):
+    # units & geolocations of a day (with its grid) inside
+    # bbox = (min lon, min lat, max lon, max lat)
+    grid = day['grid']
+    size = grid['size']
+    result = {
+        'units': {},
+        'geos': {}
+    }
+    for (side, cells) in grid['units'].items():
+        result['units'][side] = _query_cells(cells, day['units'][side],
+                                             lambda unit: unit[1], bbox, size)
+    for (side, cells) in grid['geos'].items():
+        result['geos'][side] = _query_cells(cells, day['geos'][side],
+                                            lambda geo: geo['c'], bbox, size)
+    return result
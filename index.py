@@ -1,19 +1,38 @@
 import argparse
+import asyncio
+import collections
 import csv
 import json
+import multiprocessing
 import os
 import pathlib
-import re
 import sys
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from zipfile import BadZipfile, ZipFile
 
-import requests
+import numpy as np
 from dotenv import load_dotenv
-from fastkml import geometry, kml
 
+import binformat
+import bundle
+import geo
+import grid
+import kmlstream
+import kmz
+import manifest
+import output
+import polyline
 import sidc
+import simplify
+import snapshot
+import stats
+import tiles
+import timeline
+import trajectory
+from cache import KmzCache
+from fetch import Fetcher
+from geostore import GeometryStore
 
 load_dotenv()
 
@@ -33,45 +52,78 @@ class MapData:
         self.base_date_key = ''
         self.dates = []
         self.unit_check = {}
-        self.session = requests.Session()
-        self.headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:121.0) Gecko/20100101 Firefox/121.0",
-            "Accept-Encoding": "*",
-            "Connection": "keep-alive"
-        }
-
-    def _request(self, url, content='raw'):
-
-        is_success = False
-        for _ in range(5):
-            try:
-                r = self.session.get(url, timeout=20)
-                r.raise_for_status()
-                is_success = True
-                break
-            except requests.exceptions.Timeout:
-                print("The request timed out")
-                continue
-            except requests.exceptions.RequestException as e:
-                print("An error occurred:")
-                print(e.args[0])
-                continue
-
-        if not is_success:
+        self.unit_lock = threading.Lock()
+        self.concurrency = int(os.getenv('FETCH_CONCURRENCY', '8'))
+        self.parse_workers = int(os.getenv('PARSE_WORKERS', str(os.cpu_count() or 1)))
+        # kml extraction engine: 'fastkml' (object model) or 'lxml' (streaming)
+        self.kml_engine = os.getenv('KML_ENGINE', 'fastkml')
+        self.kmz_cache = KmzCache(
+            cache_dir=os.getenv('KMZ_CACHE_DIR', './tmp/cache'),
+            max_size=int(os.getenv('KMZ_CACHE_MAX_SIZE', str(10 * 1024 ** 3))))
+        # > 0: write a delta encoded timeline to ./data/delta, with
+        # a full keyframe every n days, instead of the full daily files
+        self.keyframe_interval = int(os.getenv('KEYFRAME_INTERVAL', '0'))
+        # write frontline & area geometries once to ./data/geometry/<id>.json
+        # and refer to them by id in the daily files
+        self.geometry_store = os.getenv('GEOMETRY_STORE', '0') == '1'
+        self.geometry_precision = int(os.getenv('GEOMETRY_PRECISION', '7'))
+        # > 0: write geometries as polyline strings with this precision
+        self.polyline_precision = int(os.getenv('POLYLINE_PRECISION', '0'))
+        # precompressed siblings of the output files: 'gzip' and/or 'br'
+        self.output_encodings = output.parse_encodings(os.getenv('OUTPUT_ENCODINGS', ''))
+        # levels of detail: simplification tolerances (in degrees) for the
+        # frontline & areas, written to ./data/lod/<level>/<date>.json,
+        # level 0 is the coarsest one
+        self.lod_tolerances = self.parse_tolerances(os.getenv('LOD_TOLERANCES', ''))
+        # zoom levels of the vector tiles in ./data/tiles, e.g. '4-10'
+        self.tile_zooms = tiles.parse_zooms(os.getenv('TILE_ZOOMS', ''))
+        # 'week' or 'month': also pack the daily files into ./data/bundles
+        self.bundle_period = os.getenv('BUNDLE_PERIOD', '')
+        # per unit trajectories in ./data/trajectories, sharded by unit id
+        self.trajectories = os.getenv('TRAJECTORIES', '0') == '1'
+        self.trajectory_shard_size = int(os.getenv('TRAJECTORY_SHARD_SIZE', '64'))
+        # > 0: add a spatial grid index (cell size in degrees) to every day
+        self.grid_size = float(os.getenv('SPATIAL_INDEX', '0'))
+        # per day statistics (areas, frontline length, ...) in ./data/stats.json
+        self.stats = os.getenv('STATS', '0') == '1'
+        # processes used to serialize & write the output files
+        self.write_workers = int(os.getenv('WRITE_WORKERS', str(os.cpu_count() or 1)))
+        # also write ./data/<date>.bin (see binformat.py)
+        self.binary_output = os.getenv('BINARY_OUTPUT', '0') == '1'
+        # > 0: generate writes the days as they are done, in batches of this
+        # many days, and drops them again (bounded memory)
+        self.stream_batch = int(os.getenv('STREAM_BATCH', '0'))
+
+    async def _request_kmz(self, fetcher, item):
+
+        # cache hit by content hash, no request needed at all
+        content = await asyncio.to_thread(self.kmz_cache.get, item['path'], item['sha'])
+        if content is not None:
+            return content
+
+        # otherwise revalidate a cached copy (if any) with a conditional request
+        headers = self.kmz_cache.validators(item['path'])
+        r = await fetcher.request(item['url'], headers=headers)
+        if r is None:
             return None
-
-        if content == 'json':
-            return r.json()
-        if content == 'text':
-            return r.text
-
+        if r.status == 304:
+            content = await asyncio.to_thread(self.kmz_cache.read, item['path'])
+            if content is not None:
+                return content
+            # cached copy is gone in the meantime, fetch it again
+            r = await fetcher.request(item['url'])
+            if r is None:
+                return None
+
+        await asyncio.to_thread(self.kmz_cache.store, item['path'], r.content,
+                                r.headers.get('ETag'), r.headers.get('Last-Modified'))
         return r.content
 
     def add_unit_to_map(self, unit):
 
         # generate a new key and add unit to map
         # and update unit_names check list
-        new_unit_key = len(self.data['unit_map'].keys()) + 1
+        new_unit_key = max(self.data['unit_map'].keys(), default=0) + 1
         self.data['unit_map'][new_unit_key] = {
             'n': unit['n'],
             's': unit['s']
@@ -81,466 +133,6 @@ class MapData:
         # self.unit_check[check_key] = new_unit_key
         return new_unit_key
 
-    # pylint: disable-msg=too-many-locals
-    def get_units_and_count(self, kml_root):
-        data = {
-            'units': {
-                'ru': [],
-                'ua': []
-            },
-            'count': {
-                'ru': 0,
-                'ua': 0
-            },
-        }
-        ru_unit_folder_keys = ['Russian Unit Positions']
-        ua_unit_folder_keys = ['Ukrainian Unit Positions']
-        unit_folder = {
-            'ru': [],
-            'ua': []
-        }
-
-        for feature in kml_root.features():
-            if isinstance(feature, kml.Folder):
-                if feature.name in ru_unit_folder_keys:
-                    unit_folder['ru'].append(feature)
-                if feature.name in ua_unit_folder_keys:
-                    unit_folder['ua'].append(feature)
-
-        for (side, folders) in unit_folder.items():
-            # print(side)
-            for folder in folders:
-                # print(folder.name)
-                data['count'][side] += len(list(folder.features()))
-                for unit in folder.features():
-
-                    # ignore all units that are not placemarks
-                    # or where their geometry is not a point
-                    if not isinstance(unit, kml.Placemark):
-                        continue
-                    if not isinstance(unit.geometry, geometry.Point):
-                        continue
-
-                    unit_id = None
-                    check_key = f'{side}_{unit.name}'
-                    if check_key not in self.unit_check:
-                        unit_map_data = {
-                            'n': unit.name,
-                            's': side
-                        }
-                        unit_id = self.add_unit_to_map(unit_map_data)
-                        self.unit_check[check_key] = unit_id
-                    else:
-                        unit_id = self.unit_check[check_key]
-                        # print(f'unit bekannt: {unit.name} - {side} -> {unit_id}')
-
-                    if unit_id is None:
-                        continue
-
-                    lon = unit.geometry.coords[0][0]
-                    lat = unit.geometry.coords[0][1]
-                    unit_data = [unit_id, [lon, lat]]
-                    data['units'][side].append(unit_data)
-
-        return data
-
-    def get_geolocations(self, kml_root):
-
-        # name pattern: "[yy/mm/dd] Ua|Ru Position" - needed for old geos
-        pattern = r'\[(\d+)\/(\d+)\/(\d+)\]\s*?(?:(Ru|Ua))\s*?'
-
-        folder_keys = [
-            'Russian Federation & Pro-Russian Areas Geolocations',
-            'Ukraine Geolocations (~30 Days)',
-            'Russian Geolocations (~30 Days)',
-            'Archive Geos (1-2 Months)',
-            'Archive Geos (Older than 3 Months)',
-            'Archived Older Geolocations (2022)',
-            'Archived Older Geolocations (2023)',
-            'Archive Older Geos (2022)',
-            'Archived Older Geos (2023)',
-            'Archive Geos (Jan 2024 - Jul 2024)',
-            'Archive Geos (Jan 2024 Onwards)',
-            'Archive Geos (Jul 2024 Onwards)',
-        ]
-        folders = []
-        for feature in kml_root.features():
-            if isinstance(feature, kml.Folder):
-                # print(feature.name)
-                if feature.name in folder_keys:
-                    # print(f'==> {feature.name}')
-                    folders.append(feature)
-        for folder in folders:
-            features = folder.features()
-            for location in features:
-
-                # ignore all units that are not placemarks
-                if not isinstance(location, kml.Placemark):
-                    continue
-
-                # ignore all locations without a valid name
-                match = re.search(pattern, location.name, re.IGNORECASE)
-                if match is None:
-                    # print(f'invalid location name: {location.name}')
-                    continue
-
-                try:
-                    location.geometry
-                except AttributeError as e:
-                    print(location.name)
-                    print(f'none location: {location}')
-                    print(e.args[0])
-                    continue
-
-                # ignore all geometriers that are no point
-                # this will ignore all old polygon locations
-                if not isinstance(location.geometry, geometry.Point):
-                    continue
-
-                match = re.search(pattern, location.name)
-                if match is not None:
-                    description = '-'
-                    code = 'unknown'
-                    for ext in location.extended_data.elements:
-                        if ext.name == 'Description':
-                            description = ext.value
-                        if ext.name == 'code':
-                            code = ext.value
-
-                    code = code.lower()
-                    if code not in ['ua', 'ru']:
-                        continue
-                    # print(code)
-                    year = match.group(1)
-                    month = match.group(2)
-                    day = match.group(3)
-                    # side = match.group(4)
-                    lon = location.geometry.coords[0][0]
-                    lat = location.geometry.coords[0][1]
-                    datekey = f'20{year}{month}{day}'
-                    # print(f'{year} - {month} - {day} - {lon} - {lat} - {code}')
-                    if datekey not in self.geolocations:
-                        self.geolocations[datekey] = {
-                            'ua': [],
-                            'ru': []
-                        }
-                    self.geolocations[datekey][code].append({
-                        'c': [lon, lat],
-                        'd': description
-                    })
-
-        return
-
-    def get_fortifications(self, kml_root):
-        areas_key = 'Important Areas'
-        # fortifications_key = 'Fortifications'
-        # dragon_teeth_key = 'Dragon Teeth'
-
-        trenches_keys = [
-            'Trenches Russia',
-            'Trenches East',
-            'Trenches South',
-            'Trenches South'
-        ]
-        tankditches_keys = [
-            'Tankditches Russia',
-            'Tankditches East',
-            'Tankditches South'
-        ]
-        dragonteeth_keys = [
-            'Dragonteeth Russia',
-            'Dragonteeth East',
-            'Dragonteeth South'
-        ]
-
-
-        areas = None
-        fortifications = []
-        dragon_teeth = []
-
-        for feature in kml_root.features():
-            if isinstance(feature, kml.Folder):
-                if feature.name == areas_key:
-                    areas = feature
-        if areas is None:
-            print('no areas folder')
-            return
-
-        for feature in areas.features():
-            if isinstance(feature, kml.Placemark):
-                if feature.name in trenches_keys or feature.name in tankditches_keys:
-                    # print(feature.name)
-                    fortifications.append(feature)
-                if feature.name in dragonteeth_keys:
-                    # print(feature.name)
-                    dragon_teeth.append(feature)
-
-        for fortification in fortifications:
-            if isinstance(fortification.geometry, geometry.MultiLineString):
-                for geom in fortification.geometry.geoms:
-                    coords = []
-                    for c in geom.coords:
-                        coords.append([c[1], c[0]])
-                    self.data['fortifications'].append(coords)
-
-        for dragon in dragon_teeth:
-            if isinstance(dragon.geometry, geometry.MultiLineString):
-                for geom in dragon.geometry.geoms:
-                    coords = []
-                    for c in geom.coords:
-                        coords.append([c[1], c[0]])
-                    self.data['dragon_teeth'].append(coords)
-
-    def get_frontline(self, kml_root):
-        data = []  # list of coordinates
-        frontline_key = 'Frontline'
-        frontline_folder = None
-
-        # frontline folder
-        for feature in kml_root.features():
-            if isinstance(feature, kml.Folder):
-                if feature.name == frontline_key:
-                    frontline_folder = feature
-
-        # frotline data
-        if frontline_folder is not None:
-            for feature in frontline_folder.features():                
-                # if feature.name == frontline_key:
-                if isinstance(feature, kml.Placemark):
-                    feat_data = []
-                    coords = feature.geometry.coords
-                    for c in coords:
-                        feat_data.append([c[1], c[0]])
-                data.append(feat_data)
-
-        return data
-
-    def get_frontline_area(self, kml_root):
-        areas_key = 'Important Areas'
-        data = {
-            'ru': [],
-            'ua': [],
-        }
-
-        ru_area_keys = [
-            'Crimea',
-            'Zaporizhia and Kherson Axis [Z]',
-            'Donetsk Axis',
-            'Transnistria',
-            'Russian N Kharkiv Offensive',
-            'Russian N Kharkiv Offensive 2',
-            'Luhansk Axis',
-            'Dnipropetrovsk Axis',
-            'Russian Sumy Incursion',
-            'Russian Vovchansk Advances 2026',
-            'Dnipropetrovsk 2',
-            'Kharkiv Axis',
-            'Sumy Incursion 2',
-            'Russian Zaporizhia Advances 2026',
-            'Russian Dnipropetrovsk Advances 2026',
-            'Russian Donetsk Advances 2026',
-            'Russian Sumy Advances 2026',
-        ]
-        ru_pattern = r'^(Russian)'
-
-        # special ua areas
-        ua_area_keys = [
-            'Ukrainian Kursk Incursion'
-        ]
-
-        areas = None
-        ru_areas = []
-        ua_areas = []
-
-        for feature in kml_root.features():
-            if isinstance(feature, kml.Folder):
-                if feature.name == areas_key:
-                    areas = feature
-
-        if areas is None:
-            print('no areas folder')
-            return data
-
-        for feature in areas.features():
-            if isinstance(feature, kml.Placemark):
-                # fix non-breaking-spaces
-                feature.name = feature.name.replace('\xa0', ' ')
-                print(f'#{feature.name.strip()}#')
-                #print(type(feature.name))
-
-                if feature.name.strip() in ru_area_keys:
-                    print(f'-> {feature.name.strip()}')
-                    ru_areas.append(feature)
-                    continue
-
-                match = re.search(ru_pattern, feature.name, re.IGNORECASE)
-                if match is not None:
-                    # print(feature.name)
-                    ru_areas.append(feature)
-
-                if feature.name.strip() in ua_area_keys:
-                    ua_areas.append(feature)
-                    continue
-
-        geoms_ru = []
-        geoms_ua = []
-        for feature in ru_areas:
-            if isinstance(feature.geometry, geometry.Polygon):
-                geoms_ru.append(feature.geometry)
-            elif isinstance(feature.geometry, geometry.MultiPolygon):
-                for mpoly in feature.geometry.geoms:
-                    geoms_ru.append(mpoly)
-
-
-        for feature in ua_areas:
-            if isinstance(feature.geometry, geometry.Polygon):
-                geoms_ua.append(feature.geometry)
-            elif isinstance(feature.geometry, geometry.MultiPolygon):
-                for mpoly in feature.geometry.geoms:
-                    geoms_ua.append(mpoly)
-
-        for geom in geoms_ru:
-            poly = []
-            exterior = geom.exterior
-            if isinstance(exterior, geometry.LinearRing):
-                coords = exterior.coords
-                for c in coords:
-                    poly.append([c[1], c[0]])
-                data['ru'].append(poly)
-
-        for geom in geoms_ua:
-            poly = []
-            exterior = geom.exterior
-            if isinstance(exterior, geometry.LinearRing):
-                coords = exterior.coords
-                for c in coords:
-                    poly.append([c[1], c[0]])
-                data['ua'].append(poly)
-
-        return data
-
-    def process_kmz(self, item):
-
-        # init data set
-        data = {
-            'date_key': item['real_data_date'],
-            'unit_count': {
-                'ru': 0,
-                'ua': 0
-            },
-            'units': {
-                'ru': [],
-                'ua': []
-            },
-            'frontline': [],
-            'areas': [],            
-            'areas_ua': []
-        }
-
-        # request remote file
-        file_name = f'./tmp/{item["name"]}'
-        content = self._request(item['url'])
-
-        # some checks
-        if content is None:
-            data['bad_data'] = True
-            return data
-
-        # write kmz file to tmp dir
-        with open(file_name, mode='wb') as f:
-            f.write(content)
-
-        # unzip the kmz and read the doc.kml file
-        try:
-            with ZipFile(file_name) as zf:
-                # open doc
-                with zf.open('doc.kml') as f:
-                    doc = f.read()
-        except BadZipfile:
-            print('bad zipfile')
-            # remove tmp file
-            if os.path.exists(file_name):
-                os.remove(file_name)
-            data['bad_data'] = True
-            return data
-
-        # parse kml
-        k = kml.KML()
-        k.from_string(doc)
-
-        # get root
-        kml_doc = list(k.features())
-        kml_root = kml_doc[0]
-
-        # get styles
-        # as its redundent, we only need to get this from one kmz file
-        # self.get_styles(kml_root)
-
-        # get units & count
-        unit_data = self.get_units_and_count(kml_root)
-        data['unit_count'] = unit_data['count']
-        data['units'] = unit_data['units']
-
-        # get frontline data
-        frontline_data = self.get_frontline(kml_root)
-        data['frontline'] = frontline_data
-
-        # get frontline area
-        frontline_areas = self.get_frontline_area(kml_root)
-        data['areas'] = frontline_areas['ru']
-        data['areas_ua'] = frontline_areas['ua']
-
-        # if latest dataset, get all:
-        # + geolocations
-        # + fortifications
-        # + styles
-        if item['is_latest']:
-            self.base_date_key = item['real_data_date']
-            self.get_geolocations(kml_root)
-            self.get_fortifications(kml_root)
-            # self.get_styles(kml_root)
-
-        # remove tmp file
-        if os.path.exists(file_name):
-            os.remove(file_name)
-
-        # fnally, return processed kmz data
-        return data
-
-    def get_kmz_list_OLD(self):
-
-        # repo url
-        data_repo_api_url = os.getenv('DATA_REPO_API_URL')
-
-        # get json file listing
-        file_list_json = self._request(data_repo_api_url, 'json')
-
-        # sub method to filter all kmz files
-        def filter_kmz(item):
-            if item['type'] == 'file' and '.kmz' in item['path'] and 'latest.kmz' not in item['path']:
-                return True
-            return False
-
-        # apply filter kmz method
-        kmz_list = list(filter(filter_kmz, file_list_json))
-
-        # sub method to reoganize the data object
-        def prepare_data(item):
-            date_string = item['name'].split('_')[0]
-            return {
-                'file_date_string': date_string,
-                'real_data_date': self.substract_day(date_string, out_format='%Y%m%d'),
-                'name': item['name'],
-                'url': item['download_url'],
-                'is_latest': False
-            }
-
-        # apply prepare data method
-        data_list = list(map(prepare_data, kmz_list))
-
-        # return final data
-        return data_list
-
     def substract_day(self, date_key, in_format='%y%m%d', out_format='%y%m%d'):
         delta = timedelta(days=1)  # 1 day timedelta
         curdate = datetime.strptime(date_key, in_format)
@@ -578,20 +170,7 @@ class MapData:
     def init_data(self, dates):
         # init an empty data set for each date in the full date range
         for date_str in dates:
-            self.data['timeline'][date_str] = {
-                'unit_count': {
-                    'ru': 0,
-                    'ua': 0
-                },
-                'units': {
-                    'ru': [],
-                    'ua': []
-                },
-                'frontline': [],
-                'areas': [],
-                'areas_ua': [],
-                'geos': []
-            }
+            self.data['timeline'][date_str] = snapshot.Snapshot()
 
     def write_count_csv(self, dates):
         with open('unit_count.csv', 'w', newline='', encoding='utf-8') as file:
@@ -603,7 +182,7 @@ class MapData:
                 item = self.unit_count[s]
                 writer.writerow([s, item['ru'], item['ua']])
 
-    def save_data(self):
+    def save_base(self):
         base_data = {
             'date': self.base_date_key,
             'unit_map': self.data['unit_map'],
@@ -613,41 +192,172 @@ class MapData:
             # 'styles': self.data['styles']
         }
 
-        with open("./data/base.json", "w", encoding='utf-8') as fh:
-            json.dump(base_data, fh,
-                      sort_keys=True, separators=(',', ':'))
-        for date_key in self.data['timeline']:
-            with open(f'./data/{date_key}.json', "w", encoding='utf-8') as fh:
-                json.dump(self.data['timeline'][date_key], fh,
-                          sort_keys=True, separators=(',', ':'))
+        if self.keyframe_interval > 0:
+            base_data['keyframe_interval'] = self.keyframe_interval
+        if self.geometry_store:
+            base_data['geometry_precision'] = self.geometry_precision
+        if self.lod_tolerances:
+            base_data['lod_tolerances'] = self.lod_tolerances
+        if self.polyline_precision > 0:
+            base_data['polyline_precision'] = self.polyline_precision
+            for key in ['fortifications', 'dragon_teeth']:
+                base_data[key] = polyline.encode_all(base_data[key], self.polyline_precision)
+
+        output.write_json('./data/base.json', base_data, self.output_encodings)
+
+        if self.tile_zooms:
+            self.save_tiles({
+                'base': {
+                    'fortifications': self.data['fortifications'],
+                    'dragon_teeth': self.data['dragon_teeth']
+                }
+            })
+
+    def save_days(self, timeline_days):
+        # the daily files & everything derived from the days
+        jobs = []
+
+        if self.binary_output:
+            for (date_key, day) in timeline_days.items():
+                jobs.append((f'./data/{date_key}.bin',
+                             binformat.dumps(day, self.geometry_precision),
+                             self.output_encodings))
+
+        store = None
+        if self.geometry_store:
+            store = GeometryStore('./data/geometry', self.geometry_precision,
+                                  self.polyline_precision, self.output_encodings)
+        days = {date_key: self.encode_geometries(self.add_grid(day), store)
+                for (date_key, day) in timeline_days.items()}
+
+        # simplified frontline & areas, a client can load the coarse ones first
+        for (level, tolerance) in enumerate(self.lod_tolerances):
+            os.makedirs(f'./data/lod/{level}', exist_ok=True)
+            for (date_key, day) in timeline_days.items():
+                lod = simplify.simplify_day(day, tolerance)
+                jobs.append((f'./data/lod/{level}/{date_key}.json',
+                             self.encode_geometries(lod, store),
+                             self.output_encodings))
+
+        if self.keyframe_interval > 0:
+            written = timeline.write('./data/delta', self.dates, days, self.keyframe_interval,
+                                     self.output_encodings, self.write_workers)
+        else:
+            for date_key in days:
+                jobs.append((f'./data/{date_key}.json', days[date_key],
+                             self.output_encodings))
+            written = 0
+
+        # serialize & write in parallel, unchanged files are not touched
+        written += output.write_many(jobs, self.write_workers)
+        print(f'{written} files written')
+
+        # areas, frontline length & their changes over time
+        if self.stats:
+            stats.write('./data/stats.json', self.dates, timeline_days,
+                        self.output_encodings)
+
+        # where has each unit been
+        if self.trajectories:
+            count = trajectory.write('./data/trajectories', self.dates, timeline_days,
+                                     self.trajectory_shard_size, self.output_encodings)
+            print(f'{count} trajectory shards written')
+
+        # and cut it into vector tiles
+        if self.tile_zooms:
+            self.save_tiles(timeline_days)
+
+        # multi-day bundles of the files just written
+        if self.bundle_period:
+            self.save_bundles(timeline_days)
+
+    def save_tiles(self, days):
+        count = tiles.write_days('./data/tiles', days, self.tile_zooms,
+                                 self.output_encodings, self.write_workers)
+        print(f'{count} tiles in {len(days)} tile indexes')
+
+    def save_bundles(self, timeline_days):
+        day_dir = './data/delta' if self.keyframe_interval > 0 else './data'
+        count = bundle.write(day_dir, './data/bundles', self.dates, timeline_days,
+                             self.bundle_period, self.output_encodings)
+        print(f'{count} bundles written')
+
+    def add_grid(self, day):
+        if self.grid_size <= 0:
+            return day
+        day = day.copy()
+        if self.keyframe_interval > 0:
+            # the delta timeline rebuilds days with sorted units,
+            # the grid has to point into that order
+            day['units'] = {side: sorted(units) for (side, units) in day['units'].items()}
+        day['grid'] = grid.build(day, self.grid_size)
+        return day
+
+    def encode_geometries(self, day, store=None):
+        if store is not None:
+            return self.geometry_refs(store, day)
+        if self.polyline_precision > 0:
+            return self.polyline_geometries(day)
+        return day
+
+    def parse_tolerances(self, value):
+        # '0.001,0.01' -> [0.01, 0.001] (coarse to fine)
+        tolerances = [float(x) for x in value.split(',') if x.strip()]
+        return sorted(tolerances, reverse=True)
+
+    def geometry_refs(self, store, day):
+        # same day, but the geometries replaced with their store ids
+        day = day.copy()
+        for key in ['frontline', 'areas', 'areas_ua']:
+            day[key] = store.refs(day[key])
+        return day
+
+    def polyline_geometries(self, day):
+        # same day, but the geometries as polyline strings
+        day = day.copy()
+        for key in ['frontline', 'areas', 'areas_ua']:
+            day[key] = polyline.encode_all(day[key], self.polyline_precision)
+        return day
 
     def get_kmz_list(self):
+        return asyncio.run(self._get_kmz_list())
+
+    async def _get_kmz_list(self):
 
         kmz_list = []
 
         # repo url
         data_repo_api_url = os.getenv('DATA_REPO_API_URL')
 
-        # get json file listing
-        file_list_json = self._request(data_repo_api_url, 'json')
-
-        # sub memthod to filer the year folderss
-        def filter_years(item):
-            if item['type'] == 'dir' and not item['name'].startswith('.'):
-                return True
-            return False
-        
-        # sub method to filter all kmz files
-        def filter_kmz(item):
-            if item['type'] == 'file' and '.kmz' in item['path'] and 'latest.kmz' not in item['path']:
-                return True
-            return False
-
-        years = list(filter(filter_years, file_list_json))
-        for year in years:
-            file_list_json = self._request(f'{data_repo_api_url}/{year["name"]}', 'json')
-            kmz_list_year = list(filter(filter_kmz, file_list_json))
-            kmz_list.extend(kmz_list_year)
+        async with Fetcher(self.concurrency) as fetcher:
+
+            # get json file listing
+            file_list_json = await fetcher.get_json(data_repo_api_url)
+            # a missing listing would look like deleted days, abort instead
+            if file_list_json is None:
+                raise RuntimeError(f'could not list {data_repo_api_url}')
+
+            # sub memthod to filer the year folderss
+            def filter_years(item):
+                if item['type'] == 'dir' and not item['name'].startswith('.'):
+                    return True
+                return False
+
+            # sub method to filter all kmz files
+            def filter_kmz(item):
+                if item['type'] == 'file' and '.kmz' in item['path'] and 'latest.kmz' not in item['path']:
+                    return True
+                return False
+
+            # fetch all year folders at once
+            years = list(filter(filter_years, file_list_json))
+            year_lists = await asyncio.gather(
+                *[fetcher.get_json(f'{data_repo_api_url}/{year["name"]}') for year in years])
+            for (year, file_list_json) in zip(years, year_lists):
+                if file_list_json is None:
+                    raise RuntimeError(f'could not list {data_repo_api_url}/{year["name"]}')
+                kmz_list_year = list(filter(filter_kmz, file_list_json))
+                kmz_list.extend(kmz_list_year)
 
         # sub method to reoganize the data object
         def prepare_data(item):
@@ -656,6 +366,9 @@ class MapData:
                 'file_date_string': date_string,
                 'real_data_date': self.substract_day(date_string, out_format='%Y%m%d'),
                 'name': item['name'],
+                'path': item['path'],
+                'sha': item.get('sha'),
+                'size': item.get('size'),
                 'url': item['download_url'],
                 'is_latest': False
             }
@@ -666,7 +379,117 @@ class MapData:
         # return final data
         return data_list
 
-
+    def assign_unit_ids(self, units):
+        # deterministic unit ids: results are added in date order, and
+        # all units first seen on a date are added sorted by name & side.
+        # so the ids no longer depend on which worker finished first
+        with self.unit_lock:
+            new_units = set()
+            for (side, (names, _)) in units.items():
+                for name in names:
+                    if f'{side}_{name}' not in self.unit_check:
+                        new_units.add((name, side))
+            for (name, side) in sorted(new_units, key=lambda x: (x[0] is None, x[0] or '', x[1])):
+                unit_map_data = {
+                    'n': name,
+                    's': side
+                }
+                unit_id = self.add_unit_to_map(unit_map_data)
+                self.unit_check[f'{side}_{name}'] = unit_id
+
+    def add_result(self, result):
+        date_key = result["date_key"]
+
+        # the parse workers return units by name,
+        # map them to their unit ids here
+        self.assign_unit_ids(result['units'])
+        day = self.data['timeline'][date_key]
+        day.unit_count = result['unit_count']
+        day.units_by_side = {
+            side: snapshot.unit_arrays([self.unit_check[f'{side}_{name}'] for name in names], coords)
+            for (side, (names, coords)) in result['units'].items()
+        }
+        day.frontline = snapshot.rings(result['frontline'])
+        day.areas = snapshot.rings(result['areas'])
+        day.areas_ua = snapshot.rings(result['areas_ua'])
+
+        # base data, only extracted from the latest dataset
+        if 'geolocations' in result:
+            self.add_base_data(result)
+
+    def add_base_data(self, result):
+        self.base_date_key = result['date_key']
+        for (loc_key, geos) in result['geolocations'].items():
+            if loc_key not in self.geolocations:
+                self.geolocations[loc_key] = {
+                    'ua': [],
+                    'ru': []
+                }
+            self.geolocations[loc_key]['ua'].extend(geos['ua'])
+            self.geolocations[loc_key]['ru'].extend(geos['ru'])
+        self.data['fortifications'].extend(result['fortifications'])
+        self.data['dragon_teeth'].extend(result['dragon_teeth'])
+
+    def process(self, wanted_data, on_result=None):
+        asyncio.run(self._process(wanted_data, on_result or self.add_result))
+
+    async def _process(self, wanted_data, on_result):
+        # two stages:
+        # + the async engine downloads the kmz files
+        # + a process pool (one worker per core) parses them as they arrive
+        # the extracted data streams back here, where it is passed on
+        # in the order of wanted_data (= date order)
+        loop = asyncio.get_running_loop()
+        process_kmz = kmlstream.process_kmz if self.kml_engine == 'lxml' else kmz.process_kmz
+        # at most this many kmz are started ahead of the one on_result
+        # waits for, so a slow download can't pile up parsed days behind it
+        window = 2 * (self.concurrency + self.parse_workers)
+
+        async with Fetcher(self.concurrency) as fetcher:
+            # forkserver: this process already runs threads (to_thread,
+            # the aiohttp resolver), forking it could deadlock the workers
+            with ProcessPoolExecutor(max_workers=self.parse_workers,
+                                     mp_context=multiprocessing.get_context('forkserver')) as executor:
+
+                async def fetch_and_process(item):
+                    content = await self._request_kmz(fetcher, item)
+                    return await loop.run_in_executor(
+                        executor, process_kmz, item, content)
+
+                # started in order, so the oldest one is always next.
+                # on_result may write files (streaming generate), so it runs
+                # off the loop, the downloads in flight keep going meanwhile
+                started = collections.deque()
+                for item in wanted_data:
+                    if len(started) >= window:
+                        await asyncio.to_thread(on_result, await started.popleft())
+                    started.append(asyncio.ensure_future(fetch_and_process(item)))
+                while started:
+                    await asyncio.to_thread(on_result, await started.popleft())
+
+    def write_shard(self, shard, results, items):
+        # results of a single shard, with units still by name
+        (index, count) = shard
+        os.makedirs(self.shard_dir, exist_ok=True)
+        file_name = os.path.join(self.shard_dir, f'shard-{index}-of-{count}.json')
+        shard_data = {
+            'dates': self.dates,
+            'items': items,
+            'results': results
+        }
+        with open(file_name, 'w', encoding='utf-8') as fh:
+            json.dump(shard_data, fh, default=geo.json_default, separators=(',', ':'))
+        print(f'shard written to {file_name}')
+
+    def read_shard(self, shard):
+        (index, count) = shard
+        file_name = os.path.join(self.shard_dir, f'shard-{index}-of-{count}.json')
+        with open(file_name, encoding='utf-8') as fh:
+            shard_data = json.load(fh)
+        for result in shard_data['results']:
+            result['units'] = {side: (names, np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+                               for (side, (names, coords)) in result['units'].items()}
+        return shard_data
 
     def update(self):
         print('UPDATE DATA')
@@ -679,21 +502,52 @@ class MapData:
         self.dates = dates
 
         # get local data files
+        data_dir = './data/delta' if self.keyframe_interval > 0 else './data'
+        os.makedirs(data_dir, exist_ok=True)
+        # only the json days, <date>.bin & the compressed siblings
+        # don't make a day present
         files = [f.stem for f in pathlib.Path(
-            './data').iterdir() if f.is_file()]
-        if 'base' in files:
-            files.remove('base')  # remove 'base' from list
-
-        # create a diff to find all missing data
+            data_dir).iterdir() if f.is_file() and f.suffix == '.json']
+        for name in ['base', 'manifest', 'stats', 'sidc_memo']:
+            if name in files:
+                files.remove(name)
+
+        # upstream files which are new, republished or went
+        # through an older extractor since the last run
+        new_manifest = manifest.build(data_list, kmz.EXTRACTOR_VERSION)
+        old_manifest = manifest.read('./data/manifest.json')
+        if old_manifest is None:
+            # no manifest yet, take the existing files as they are
+            print('no manifest, starting a new one')
+            changed = set()
+            removed = []
+        else:
+            changed = manifest.changed_dates(old_manifest, new_manifest)
+            removed = sorted(manifest.removed_dates(old_manifest, new_manifest))
+            if removed:
+                print(f'warning: no upstream files left for {removed}, keeping their days')
+
+        # create a diff to find all missing or changed data
         s = set(files)
-        diff = [x for x in dates if x not in s]
+        diff = [x for x in dates if x not in s or x in changed]
         print(diff)
 
         if len(diff) == 0:
+            manifest.write('./data/manifest.json', new_manifest)
             print('nothing to update')
             return
         # so we have missing data
 
+        # the deltas of the following days depend on the missing ones,
+        # so redo everything from the first missing day on
+        if self.keyframe_interval > 0:
+            diff = dates[dates.index(diff[0]):]
+            # a day without upstream files can't be redone
+            kept = [x for x in removed if x in s and x in diff]
+            if kept:
+                raise RuntimeError(f'the deltas after {kept} (no upstream files left) '
+                                   'can only be rebuilt by a full generate (-g)')
+
         # add latest date to the diff list
         diff.append(dates[-1])
         print(diff)
@@ -742,29 +596,17 @@ class MapData:
         # init data (will be filled later on)
         self.init_data(diff)
 
-        # threadpool to process the data
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            thread = executor.map(self.process_kmz, wanted_data)
-            for result in thread:
-                date_key = result["date_key"]
-                self.data['timeline'][date_key]['unit_count'] = result['unit_count']
-                self.data['timeline'][date_key]['units'] = result['units']
-                self.data['timeline'][date_key]['frontline'] = result['frontline']
-                self.data['timeline'][date_key]['areas'] = result['areas']
-                self.data['timeline'][date_key]['areas_ua'] = result['areas_ua']
-
-        # add geolocations into the timeline object
-        for (loc_key, geos) in self.geolocations.items():
-            if loc_key in self.data['timeline']:
-                self.data['timeline'][loc_key]['geos'] = geos
+        # download & process the data
+        self.process(wanted_data)
 
-        # update sidc
-        self.data['unit_map'] = sidc.update(self.data['unit_map'])
+        # geolocations, sidc & save
+        self.finish()
+        manifest.write('./data/manifest.json', new_manifest)
 
-        # finally, save the data to <date>.json & base.json
-        self.save_data()
+        # persist the kmz cache index for the next run
+        self.kmz_cache.save()
 
-    def generate(self):
+    def generate(self, shard=None):
 
         # read the kmz backup repository
         data_list = self.get_kmz_list()
@@ -775,34 +617,132 @@ class MapData:
         dates = self.generate_date_range_list(data_list)
         self.dates = dates
 
-        # init data (will be filled later on)
-        self.init_data(dates)
-
         # define what data we want to process
         wanted_data = data_list
         # wanted_data = data_list[-10:]
         # wanted_data = data_list[:5]
 
-        # threadpool to process the data
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            thread = executor.map(self.process_kmz, wanted_data)
-            for result in thread:
-                date_key = result["date_key"]
-                self.data['timeline'][date_key]['unit_count'] = result['unit_count']
-                self.data['timeline'][date_key]['units'] = result['units']
-                self.data['timeline'][date_key]['frontline'] = result['frontline']
-                self.data['timeline'][date_key]['areas'] = result['areas']
+        # shard i/N only processes the i-th block of the kmz list,
+        # the results are written as they are and combined later on by merge()
+        if shard is not None:
+            (index, count) = shard
+            start = (index - 1) * len(data_list) // count
+            end = index * len(data_list) // count
+            results = []
+            self.process(data_list[start:end], results.append)
+            self.write_shard(shard, results, data_list[start:end])
+            self.kmz_cache.save()
+            return
+
+        # bounded memory: write the days as they are done
+        if self.stream_batch > 0:
+            self.generate_stream(data_list)
+            self.save_manifest(data_list)
+            self.kmz_cache.save()
+            return
 
+        # init data (will be filled later on)
+        self.init_data(dates)
+
+        # download & process the data
+        self.process(wanted_data)
+
+        # geolocations, sidc & save
+        self.finish()
+        self.save_manifest(data_list)
+
+        # persist the kmz cache index for the next run
+        self.kmz_cache.save()
+
+    def save_manifest(self, data_list):
+        # what the days were built from, see manifest.py
+        manifest.write('./data/manifest.json', manifest.build(data_list, kmz.EXTRACTOR_VERSION))
+
+    def generate_stream(self, data_list):
+        self.date_positions = {date_key: position for (position, date_key) in enumerate(self.dates)}
+        self.stream_next = 0
+
+        # the latest kmz first, its geolocations go into the days written.
+        # its own day is added last, in date order like in a full run,
+        # so the unit ids are the same
+        latest = []
+        self.process(data_list[-1:], latest.append)
+        latest = latest[0]
+        if 'geolocations' in latest:
+            self.add_base_data(latest)
+            del latest['geolocations']
+
+        self.process(data_list[:-1], self.add_stream_result)
+        self.add_stream_result(latest)
+        self.init_data(self.dates[self.stream_next:])
+        self.flush_stream(len(self.dates), force=True)
+
+        # update sidc & save base.json
+        self.data['unit_map'] = self.update_sidc(self.data['unit_map'])
+        self.save_base()
+
+    def add_stream_result(self, result):
+        date_key = result['date_key']
+        position = self.date_positions[date_key]
+        if position >= self.stream_next:
+            # this day and the empty ones before it
+            self.init_data(self.dates[self.stream_next:position + 1])
+            self.stream_next = position + 1
+        elif date_key not in self.data['timeline']:
+            # already written, a later kmz of the same day redoes it
+            self.init_data([date_key])
+        self.add_result(result)
+        # the days before this one are done
+        self.flush_stream(position)
+
+    def flush_stream(self, end, force=False):
+        # writes & drops the days before position `end`, once there are enough of them
+        done = [date_key for date_key in self.data['timeline'] if self.date_positions[date_key] < end]
+        if not done or (len(done) < self.stream_batch and not force):
+            return
+        days = {date_key: self.data['timeline'].pop(date_key)
+                for date_key in sorted(done, key=self.date_positions.get)}
+        self.add_geolocations(days)
+        self.save_days(days)
+
+    def merge(self, count):
+        # combine the shards of 'generate --shard i/N' runs, in shard order,
+        # so the unit ids are the same as the ones of a single generate run
+        shards = [self.read_shard((index, count)) for index in range(1, count + 1)]
+        self.dates = shards[0]['dates']
+        self.init_data(self.dates)
+        for shard_data in shards:
+            for result in shard_data['results']:
+                self.add_result(result)
+
+        # geolocations, sidc & save
+        self.finish()
+        self.save_manifest([item for shard_data in shards for item in shard_data['items']])
+
+    def add_geolocations(self, timeline_days):
         # add geolocations into the timeline object
         for (loc_key, geos) in self.geolocations.items():
-            if loc_key in self.data['timeline']:
-                self.data['timeline'][loc_key]['geos'] = geos
+            if loc_key in timeline_days:
+                timeline_days[loc_key]['geos'] = geos
+
+    def finish(self):
+
+        self.add_geolocations(self.data['timeline'])
 
         # update sidc
-        self.data['unit_map'] = sidc.update(self.data['unit_map'])
+        self.data['unit_map'] = self.update_sidc(self.data['unit_map'])
 
         # finally, save the data to <date>.json & base.json
-        self.save_data()
+        self.save_days(self.data['timeline'])
+        self.save_base()
+
+    def update_sidc(self, unit_map, force=False):
+        # units classified by an earlier run (same name, side &
+        # rule set version) are taken from the memo next to base.json
+        memo = {} if force else sidc.load_memo('./data/sidc_memo.json')
+        unit_map = sidc.update(unit_map, memo)
+        sidc.save_memo('./data/sidc_memo.json', memo)
+        return unit_map
 
     def check_sidc(self):
         data = {}
@@ -822,10 +762,10 @@ class MapData:
             print("Invalid JSON syntax:", e)
 
         if 'unit_map' in data:
-            data['unit_map'] = sidc.update(data['unit_map'])
-            # safe json file
-            with open("./data/base.json", "w", encoding='utf-8') as fh:
-                json.dump(data, fh, sort_keys=True, separators=(',', ':'))
+            # reclassify all units, and start the memo over
+            data['unit_map'] = self.update_sidc(data['unit_map'], force=True)
+            # safe json file, with its compressed siblings
+            output.write_json('./data/base.json', data, self.output_encodings)
 
 
 if __name__ == '__main__':
@@ -840,15 +780,83 @@ if __name__ == '__main__':
                      help="check unit 2 sidc")
     grp.add_argument("-f", "--force", action="store_true",
                      help="force sidc update")
+    grp.add_argument("-m", "--merge", type=int, metavar="N",
+                     help="merge the results of N generate shards")
+    argParser.add_argument("--shard", metavar="i/N",
+                           help="with -g, only process shard i of N (1-based)")
+    argParser.add_argument("--shard-dir", default="./tmp/shards",
+                           help="directory for shard results")
+    argParser.add_argument("-k", "--keyframes", type=int, metavar="N",
+                           help="write a delta encoded timeline with a keyframe every N days")
+    argParser.add_argument("--geometry-store", action="store_true",
+                           help="write geometries to data/geometry and refer to them by id")
+    argParser.add_argument("--polyline", type=int, metavar="P",
+                           help="write geometries as polyline strings with precision P")
+    argParser.add_argument("--compress", metavar="ENCODINGS",
+                           help="also write precompressed outputs, e.g. gzip or gzip,br")
+    argParser.add_argument("--lod", metavar="TOLERANCES",
+                           help="also write simplified levels of detail, e.g. 0.01,0.001 (degrees)")
+    argParser.add_argument("--tiles", metavar="ZOOMS",
+                           help="also write vector tiles for these zoom levels, e.g. 4-10")
+    argParser.add_argument("--bundle", choices=bundle.PERIODS,
+                           help="also pack the daily files into weekly or monthly bundles")
+    argParser.add_argument("--trajectories", action="store_true",
+                           help="also write the per unit trajectory index")
+    argParser.add_argument("--grid", type=float, metavar="SIZE",
+                           help="add a spatial grid index with SIZE degree cells to every day")
+    argParser.add_argument("--stats", action="store_true",
+                           help="also write the per day statistics (data/stats.json)")
+    argParser.add_argument("--binary", action="store_true",
+                           help="also write the binary timeline format (data/<date>.bin)")
+    argParser.add_argument("--stream", type=int, nargs="?", const=32, metavar="DAYS",
+                           help="with -g, write the days in batches of DAYS (default 32) as they are done")
     args = argParser.parse_args()
 
+    shard = None
+    if args.shard is not None:
+        if not args.generate:
+            argParser.error('--shard can only be used with -g')
+        try:
+            shard = tuple(int(x) for x in args.shard.split('/'))
+        except ValueError:
+            argParser.error('--shard must be i/N, e.g. 1/4')
+        if len(shard) != 2 or not 1 <= shard[0] <= shard[1]:
+            argParser.error('--shard must be i/N with 1 <= i <= N')
+
     # INIT MapData CLASS
     mapdata = MapData()
+    mapdata.shard_dir = args.shard_dir
+    if args.keyframes is not None:
+        mapdata.keyframe_interval = args.keyframes
+    if args.geometry_store:
+        mapdata.geometry_store = True
+    if args.polyline is not None:
+        mapdata.polyline_precision = args.polyline
+    if args.compress is not None:
+        mapdata.output_encodings = output.parse_encodings(args.compress)
+    if args.binary:
+        mapdata.binary_output = True
+    if args.stream is not None:
+        mapdata.stream_batch = args.stream
+    if args.stats:
+        mapdata.stats = True
+    if args.grid is not None:
+        mapdata.grid_size = args.grid
+    if args.trajectories:
+        mapdata.trajectories = True
+    if args.bundle is not None:
+        mapdata.bundle_period = args.bundle
+    if args.tiles is not None:
+        mapdata.tile_zooms = tiles.parse_zooms(args.tiles)
+    if args.lod is not None:
+        mapdata.lod_tolerances = mapdata.parse_tolerances(args.lod)
 
     # depending on the type of action we
     # now run generate or update
     if args.generate:
-        mapdata.generate()
+        mapdata.generate(shard)
+    elif args.merge:
+        mapdata.merge(args.merge)
     elif args.update:
         mapdata.update()
     elif args.sidc:
@@ -0,0 +1,337 @@
+import io
+import re
+from zipfile import BadZipfile, ZipFile
+
+import numpy as np
+from lxml import etree
+
+import geo
+import kmz
+import snapshot
+
+# streaming kml extraction
+# an alternative to the fastkml object model in kmz.py: the doc.kml is read
+# with lxml.etree.iterparse, only the folders we are interested in are looked
+# at and every placemark is dropped from the tree as soon as it is processed.
+# the output is the same as the one of kmz.process_kmz
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else None
+
+
+def _find(elem, name):
+    for child in elem:
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def _findall(elem, name):
+    return [child for child in elem if _local(child.tag) == name]
+
+
+def _coordinates(elem):
+    # (n, 2|3) array of lon, lat[, alt]
+    coordinates = _find(elem, 'coordinates')
+    if coordinates is None:
+        return geo.parse_coordinates(None)
+    return geo.parse_coordinates(coordinates.text)
+
+
+def _ring(elem):
+    return geo.close_ring(_coordinates(elem))
+
+
+def _exterior(polygon):
+    outer_boundary = _find(polygon, 'outerBoundaryIs')
+    if outer_boundary is None:
+        return None
+    ring = _find(outer_boundary, 'LinearRing')
+    if ring is None:
+        return None
+    return _ring(ring)
+
+
+def _geometry(placemark):
+    # returns (type, geometry element), with the same precedence as fastkml
+    for name in ['Point', 'LineString', 'Polygon', 'LinearRing', 'MultiGeometry']:
+        elem = _find(placemark, name)
+        if elem is not None:
+            return (name, elem)
+    return (None, None)
+
+
+def _multi_geometry_type(elem):
+    # MultiLineString, MultiPolygon, ... or None for mixed collections
+    geom_types = {_local(child.tag) for child in elem} & {'Point', 'LineString', 'Polygon', 'LinearRing'}
+    if len(geom_types) != 1:
+        return None
+    return f'Multi{geom_types.pop()}'
+
+
+def _name(elem):
+    name = _find(elem, 'name')
+    return name.text if name is not None else None
+
+
+def _unit(placemark, side, units):
+    (geom_type, geom) = _geometry(placemark)
+    if geom_type != 'Point':
+        return
+    coordinates = _find(geom, 'coordinates')
+    # only the first tuple of the point is needed: "lon,lat[,alt]"
+    lonlat = re.sub(r", +", ",", coordinates.text.strip()).split()[0].split(',')
+    units[side][0].append(_name(placemark))
+    units[side][1].append(float(lonlat[0]))
+    units[side][1].append(float(lonlat[1]))
+
+
+def _frontline(placemark, data):
+    (geom_type, geom) = _geometry(placemark)
+    if geom_type == 'Point':
+        coords = _coordinates(geom)[:1]
+    elif geom_type == 'LineString':
+        coords = _coordinates(geom)
+    elif geom_type == 'LinearRing':
+        coords = _ring(geom)
+    else:
+        return
+    data['frontline'].append(geo.latlon(coords))
+
+
+def _area(placemark, data, is_latest):
+    name = kmz.normalize_name(_name(placemark))
+    if name is None:
+        return
+
+    keys = []
+    if name in kmz.RU_AREA_KEYS:
+        keys = ['areas']
+    else:
+        if re.search(kmz.RU_AREA_PATTERN, name, re.IGNORECASE) is not None:
+            keys.append('areas')
+        if name in kmz.UA_AREA_KEYS:
+            keys.append('areas_ua')
+
+    (geom_type, geom) = _geometry(placemark)
+    polygons = []
+    if geom_type == 'Polygon':
+        polygons = [geom]
+    elif geom_type == 'MultiGeometry' and _multi_geometry_type(geom) == 'MultiPolygon':
+        polygons = _findall(geom, 'Polygon')
+    for key in keys:
+        for polygon in polygons:
+            exterior = _exterior(polygon)
+            if exterior is not None:
+                data[key].append(geo.latlon(exterior))
+
+    # fortifications & dragon teeth, only needed for the latest dataset
+    if not is_latest:
+        return
+    if geom_type != 'MultiGeometry' or _multi_geometry_type(geom) != 'MultiLineString':
+        return
+    key = None
+    if name in kmz.TRENCHES_KEYS or name in kmz.TANKDITCHES_KEYS:
+        key = 'fortifications'
+    elif name in kmz.DRAGONTEETH_KEYS:
+        key = 'dragon_teeth'
+    if key is not None:
+        for line in _findall(geom, 'LineString'):
+            data[key].append(geo.latlon(_coordinates(line)))
+
+
+def _geolocation(placemark, data):
+    name = _name(placemark)
+    if name is None:
+        return
+    (geom_type, geom) = _geometry(placemark)
+    if geom_type != 'Point':
+        return
+    match = re.search(kmz.GEOLOCATION_PATTERN, name)
+    if match is None:
+        return
+
+    description = '-'
+    code = 'unknown'
+    extended_data = _find(placemark, 'ExtendedData')
+    if extended_data is not None:
+        for ext in _findall(extended_data, 'Data'):
+            value = _find(ext, 'value')
+            value = value.text if value is not None else None
+            if ext.get('name') == 'Description':
+                description = value
+            if ext.get('name') == 'code':
+                code = value
+    if code is None:
+        return
+    code = code.lower()
+    if code not in ['ua', 'ru']:
+        return
+
+    coords = _coordinates(geom)
+    datekey = f'20{match.group(1)}{match.group(2)}{match.group(3)}'
+    if datekey not in data['geolocations']:
+        data['geolocations'][datekey] = {
+            'ua': [],
+            'ru': []
+        }
+    data['geolocations'][datekey][code].append({
+        'c': [float(coords[0][0]), float(coords[0][1])],
+        'd': description
+    })
+
+
+def _folder_kind(name, is_latest):
+    name = kmz.normalize_name(name)
+    if name in kmz.RU_UNIT_FOLDER_KEYS:
+        return 'ru'
+    if name in kmz.UA_UNIT_FOLDER_KEYS:
+        return 'ua'
+    if name == kmz.FRONTLINE_FOLDER_KEY:
+        return 'frontline'
+    if name == kmz.AREAS_FOLDER_KEY:
+        return 'areas'
+    if is_latest and name in kmz.GEOLOCATION_FOLDER_KEYS:
+        return 'geolocations'
+    return None
+
+
+def extract(f, is_latest):
+    data = {
+        'unit_count': {
+            'ru': 0,
+            'ua': 0
+        },
+        'units': {
+            'ru': ([], np.empty((0, 2))),
+            'ua': ([], np.empty((0, 2)))
+        },
+        'frontline': [],
+        'areas': [],
+        'areas_ua': [],
+        'geolocations': {},
+        'fortifications': [],
+        'dragon_teeth': []
+    }
+
+    # depth of the current element: kml (1) > Document (2) > Folder (3) > feature (4)
+    depth = 0
+    documents = 0
+    # unit names & flat lon, lat values per side
+    units = {
+        'ru': ([], []),
+        'ua': ([], [])
+    }
+    folder = None  # top level folder we are currently in
+    folder_kind = None
+
+    context = etree.iterparse(f, events=('start', 'end'), huge_tree=True, recover=True)
+    for (event, elem) in context:
+        if event == 'start':
+            depth += 1
+            tag = _local(elem.tag)
+            if depth == 2 and tag == 'Document':
+                documents += 1
+            if depth == 3 and documents == 1 and tag == 'Folder':
+                folder = elem
+                folder_kind = None
+            continue
+
+        tag = _local(elem.tag)
+        in_folder = folder is not None and depth >= 4
+
+        # the folder name comes first, so we know what to do
+        # with the placemarks that follow
+        if in_folder and depth == 4 and tag == 'name' and folder_kind is None:
+            folder_kind = _folder_kind(elem.text, is_latest)
+            # the last frontline & areas folders win, as in kmz.py
+            if folder_kind == 'frontline':
+                data['frontline'] = []
+            elif folder_kind == 'areas':
+                data['areas'] = []
+                data['areas_ua'] = []
+                data['fortifications'] = []
+                data['dragon_teeth'] = []
+
+        elif in_folder and depth == 4 and tag in ['Folder', 'Placemark', 'Document']:
+            if folder_kind in ['ru', 'ua']:
+                data['unit_count'][folder_kind] += 1
+            if tag == 'Placemark':
+                if folder_kind in ['ru', 'ua']:
+                    _unit(elem, folder_kind, units)
+                elif folder_kind == 'frontline':
+                    _frontline(elem, data)
+                elif folder_kind == 'areas':
+                    _area(elem, data, is_latest)
+                elif folder_kind == 'geolocations':
+                    _geolocation(elem, data)
+            # done with this feature, drop it
+            elem.clear()
+            folder.remove(elem)
+
+        elif depth == 3:
+            # end of a top level element (folder, style, ...)
+            if elem is folder:
+                folder = None
+                folder_kind = None
+            parent = elem.getparent()
+            elem.clear()
+            if parent is not None:
+                parent.remove(elem)
+
+        depth -= 1
+
+    for (side, (names, values)) in units.items():
+        if names:
+            data['units'][side] = (names, np.array(values).reshape(-1, 2))
+
+    return data
+
+
+def process_kmz(item, content):
+
+    # init data set
+    data = {
+        'date_key': item['real_data_date'],
+        'unit_count': {
+            'ru': 0,
+            'ua': 0
+        },
+        'units': {
+            'ru': ([], np.empty((0, 2))),
+            'ua': ([], np.empty((0, 2)))
+        },
+        'frontline': [],
+        'areas': [],
+        'areas_ua': []
+    }
+
+    # some checks
+    if content is None:
+        data['bad_data'] = True
+        return data
+
+    # stream the doc.kml member straight out of the kmz buffer
+    try:
+        with ZipFile(io.BytesIO(content)) as zf:
+            with zf.open('doc.kml') as f:
+                extracted = extract(f, item['is_latest'])
+    except (BadZipfile, KeyError):
+        print('bad zipfile')
+        data['bad_data'] = True
+        return data
+
+    data['unit_count'] = extracted['unit_count']
+    data['units'] = extracted['units']
+    data['frontline'] = snapshot.Rings.from_list(extracted['frontline'])
+    data['areas'] = snapshot.Rings.from_list(extracted['areas'])
+    data['areas_ua'] = snapshot.Rings.from_list(extracted['areas_ua'])
+
+    # base data, only for the latest dataset
+    if item['is_latest']:
+        data['geolocations'] = extracted['geolocations']
+        data['fortifications'] = extracted['fortifications']
+        data['dragon_teeth'] = extracted['dragon_teeth']
+
+    return data
@@ -0,0 +1,438 @@
+import io
+import re
+from zipfile import BadZipfile, ZipFile
+
+import numpy as np
+from fastkml import geometry, kml
+from lxml import etree
+
+import geo
+import snapshot
+
+# kmz parsing & extraction
+# everything in here is free of shared state, so it can run
+# in a worker process and only the extracted data is sent back
+
+# bump when a change in here (or in kmlstream.py) changes the extracted
+# data, update() then redoes the days built by an older version
+EXTRACTOR_VERSION = 1
+
+# unit folders
+RU_UNIT_FOLDER_KEYS = ['Russian Unit Positions']
+UA_UNIT_FOLDER_KEYS = ['Ukrainian Unit Positions']
+
+# frontline folder
+FRONTLINE_FOLDER_KEY = 'Frontline'
+
+# areas & fortifications folder
+AREAS_FOLDER_KEY = 'Important Areas'
+# fortifications_key = 'Fortifications'
+# dragon_teeth_key = 'Dragon Teeth'
+
+RU_AREA_KEYS = [
+    'Crimea',
+    'Zaporizhia and Kherson Axis [Z]',
+    'Donetsk Axis',
+    'Transnistria',
+    'Russian N Kharkiv Offensive',
+    'Russian N Kharkiv Offensive 2',
+    'Luhansk Axis',
+    'Dnipropetrovsk Axis',
+    'Russian Sumy Incursion',
+    'Russian Vovchansk Advances 2026',
+    'Dnipropetrovsk 2',
+    'Kharkiv Axis',
+    'Sumy Incursion 2',
+    'Russian Zaporizhia Advances 2026',
+    'Russian Dnipropetrovsk Advances 2026',
+    'Russian Donetsk Advances 2026',
+    'Russian Sumy Advances 2026',
+]
+RU_AREA_PATTERN = r'^(Russian)'
+
+# special ua areas
+UA_AREA_KEYS = [
+    'Ukrainian Kursk Incursion'
+]
+
+TRENCHES_KEYS = [
+    'Trenches Russia',
+    'Trenches East',
+    'Trenches South',
+    'Trenches South'
+]
+TANKDITCHES_KEYS = [
+    'Tankditches Russia',
+    'Tankditches East',
+    'Tankditches South'
+]
+DRAGONTEETH_KEYS = [
+    'Dragonteeth Russia',
+    'Dragonteeth East',
+    'Dragonteeth South'
+]
+
+# geolocation folders
+GEOLOCATION_FOLDER_KEYS = [
+    'Russian Federation & Pro-Russian Areas Geolocations',
+    'Ukraine Geolocations (~30 Days)',
+    'Russian Geolocations (~30 Days)',
+    'Archive Geos (1-2 Months)',
+    'Archive Geos (Older than 3 Months)',
+    'Archived Older Geolocations (2022)',
+    'Archived Older Geolocations (2023)',
+    'Archive Older Geos (2022)',
+    'Archived Older Geos (2023)',
+    'Archive Geos (Jan 2024 - Jul 2024)',
+    'Archive Geos (Jan 2024 Onwards)',
+    'Archive Geos (Jul 2024 Onwards)',
+]
+# name pattern: "[yy/mm/dd] Ua|Ru Position" - needed for old geos
+GEOLOCATION_PATTERN = r'\[(\d+)\/(\d+)\/(\d+)\]\s*?(?:(Ru|Ua))\s*?'
+
+
+def normalize_name(name):
+    # fix non-breaking-spaces and surrounding whitespace
+    if name is None:
+        return None
+    return name.replace('\xa0', ' ').strip()
+
+
+class FolderEntry:
+
+    __slots__ = ('folder', 'features', 'placemarks')
+
+    def __init__(self, folder):
+        self.folder = folder
+        # folder.features() is a generator, walk it only once
+        self.features = list(folder.features())
+        # (normalized name, placemark), in document order
+        self.placemarks = [(normalize_name(feature.name), feature)
+                           for feature in self.features
+                           if isinstance(feature, kml.Placemark)]
+
+
+class KmlIndex:
+
+    # index of the top level folders of a kml document, built in one pass.
+    # folders are looked up by their normalized name
+
+    def __init__(self, kml_root):
+        self.folders = {}
+        for (position, feature) in enumerate(kml_root.features()):
+            if isinstance(feature, kml.Folder):
+                name = normalize_name(feature.name)
+                self.folders.setdefault(name, []).append((position, FolderEntry(feature)))
+
+    def find_all(self, names):
+        # all folders with one of the given names, in document order
+        entries = []
+        for name in set(names):
+            entries.extend(self.folders.get(name, []))
+        return [entry for (_, entry) in sorted(entries, key=lambda x: x[0])]
+
+    def find(self, name):
+        # the last folder with the given name (or None)
+        entries = self.folders.get(name, [])
+        return entries[-1][1] if entries else None
+
+
+# pylint: disable-msg=too-many-locals
+def get_units_and_count(kml_index):
+    data = {
+        'units': {
+            'ru': ([], np.empty((0, 2))),
+            'ua': ([], np.empty((0, 2)))
+        },
+        'count': {
+            'ru': 0,
+            'ua': 0
+        },
+    }
+    unit_folder = {
+        'ru': kml_index.find_all(RU_UNIT_FOLDER_KEYS),
+        'ua': kml_index.find_all(UA_UNIT_FOLDER_KEYS)
+    }
+
+    for (side, folders) in unit_folder.items():
+        # print(side)
+        names = []
+        coords = []
+        for folder in folders:
+            # print(folder.name)
+            data['count'][side] += len(folder.features)
+            for (_, unit) in folder.placemarks:
+
+                # ignore all units where their geometry is not a point
+                if not isinstance(unit.geometry, geometry.Point):
+                    continue
+
+                # units are stored by name here, the unit id
+                # is assigned later on in the main process
+                names.append(unit.name)
+                coords.append(unit.geometry.coords[0][:2])
+
+        # (names, (n, 2) array of lon, lat)
+        if coords:
+            data['units'][side] = (names, geo.from_coords(coords))
+
+    return data
+
+
+def get_geolocations(kml_index):
+    geolocations = {}
+    folders = kml_index.find_all(GEOLOCATION_FOLDER_KEYS)
+    for folder in folders:
+        for (_, location) in folder.placemarks:
+
+            # ignore all locations without a valid name
+            match = re.search(GEOLOCATION_PATTERN, location.name, re.IGNORECASE)
+            if match is None:
+                # print(f'invalid location name: {location.name}')
+                continue
+
+            try:
+                location.geometry
+            except AttributeError as e:
+                print(location.name)
+                print(f'none location: {location}')
+                print(e.args[0])
+                continue
+
+            # ignore all geometriers that are no point
+            # this will ignore all old polygon locations
+            if not isinstance(location.geometry, geometry.Point):
+                continue
+
+            match = re.search(GEOLOCATION_PATTERN, location.name)
+            if match is not None:
+                description = '-'
+                code = 'unknown'
+                for ext in location.extended_data.elements:
+                    if ext.name == 'Description':
+                        description = ext.value
+                    if ext.name == 'code':
+                        code = ext.value
+
+                code = code.lower()
+                if code not in ['ua', 'ru']:
+                    continue
+                # print(code)
+                year = match.group(1)
+                month = match.group(2)
+                day = match.group(3)
+                # side = match.group(4)
+                lon = location.geometry.coords[0][0]
+                lat = location.geometry.coords[0][1]
+                datekey = f'20{year}{month}{day}'
+                # print(f'{year} - {month} - {day} - {lon} - {lat} - {code}')
+                if datekey not in geolocations:
+                    geolocations[datekey] = {
+                        'ua': [],
+                        'ru': []
+                    }
+                geolocations[datekey][code].append({
+                    'c': [lon, lat],
+                    'd': description
+                })
+
+    return geolocations
+
+
+def get_fortifications(kml_index):
+    fortifications = []
+    dragon_teeth = []
+
+    areas = kml_index.find(AREAS_FOLDER_KEY)
+    if areas is None:
+        print('no areas folder')
+        return (fortifications, dragon_teeth)
+
+    fortification_features = []
+    dragon_teeth_features = []
+    for (name, feature) in areas.placemarks:
+        if name in TRENCHES_KEYS or name in TANKDITCHES_KEYS:
+            # print(name)
+            fortification_features.append(feature)
+        if name in DRAGONTEETH_KEYS:
+            # print(name)
+            dragon_teeth_features.append(feature)
+
+    for fortification in fortification_features:
+        if isinstance(fortification.geometry, geometry.MultiLineString):
+            for geom in fortification.geometry.geoms:
+                fortifications.append(geo.latlon(geo.from_coords(geom.coords)))
+
+    for dragon in dragon_teeth_features:
+        if isinstance(dragon.geometry, geometry.MultiLineString):
+            for geom in dragon.geometry.geoms:
+                dragon_teeth.append(geo.latlon(geo.from_coords(geom.coords)))
+
+    return (fortifications, dragon_teeth)
+
+
+def get_frontline(kml_index):
+    data = []  # list of coordinates
+
+    # frontline folder
+    frontline_folder = kml_index.find(FRONTLINE_FOLDER_KEY)
+
+    # frotline data
+    if frontline_folder is not None:
+        for (_, feature) in frontline_folder.placemarks:
+            coords = geo.from_coords(feature.geometry.coords)
+            data.append(geo.latlon(coords))
+
+    return data
+
+
+def get_frontline_area(kml_index):
+    data = {
+        'ru': [],
+        'ua': [],
+    }
+
+    ru_areas = []
+    ua_areas = []
+
+    areas = kml_index.find(AREAS_FOLDER_KEY)
+    if areas is None:
+        print('no areas folder')
+        return data
+
+    for (name, feature) in areas.placemarks:
+        # name is already normalized (non-breaking-spaces)
+        if name is None:
+            continue
+        print(f'#{name}#')
+
+        if name in RU_AREA_KEYS:
+            print(f'-> {name}')
+            ru_areas.append(feature)
+            continue
+
+        match = re.search(RU_AREA_PATTERN, name, re.IGNORECASE)
+        if match is not None:
+            # print(name)
+            ru_areas.append(feature)
+
+        if name in UA_AREA_KEYS:
+            ua_areas.append(feature)
+            continue
+
+    geoms_ru = []
+    geoms_ua = []
+    for feature in ru_areas:
+        if isinstance(feature.geometry, geometry.Polygon):
+            geoms_ru.append(feature.geometry)
+        elif isinstance(feature.geometry, geometry.MultiPolygon):
+            for mpoly in feature.geometry.geoms:
+                geoms_ru.append(mpoly)
+
+
+    for feature in ua_areas:
+        if isinstance(feature.geometry, geometry.Polygon):
+            geoms_ua.append(feature.geometry)
+        elif isinstance(feature.geometry, geometry.MultiPolygon):
+            for mpoly in feature.geometry.geoms:
+                geoms_ua.append(mpoly)
+
+    for geom in geoms_ru:
+        exterior = geom.exterior
+        if isinstance(exterior, geometry.LinearRing):
+            coords = geo.from_coords(exterior.coords)
+            data['ru'].append(geo.latlon(coords))
+
+    for geom in geoms_ua:
+        exterior = geom.exterior
+        if isinstance(exterior, geometry.LinearRing):
+            coords = geo.from_coords(exterior.coords)
+            data['ua'].append(geo.latlon(coords))
+
+    return data
+
+
+def parse_kml(f):
+    # parse the doc.kml stream with lxml and build the fastkml document
+    # from the element tree, so we never hold the raw xml bytes in memory
+    parser = etree.XMLParser(huge_tree=True, recover=True)
+    element = etree.parse(f, parser=parser).getroot()
+    ns = element.tag[:-len('kml')]
+    document = element.find(f'{ns}Document')
+    if document is not None:
+        kml_root = kml.Document(ns)
+        kml_root.from_element(document)
+    else:
+        kml_root = kml.Folder(ns)
+        kml_root.from_element(element.find(f'{ns}Folder'))
+    return kml_root
+
+
+def process_kmz(item, content):
+
+    # init data set
+    data = {
+        'date_key': item['real_data_date'],
+        'unit_count': {
+            'ru': 0,
+            'ua': 0
+        },
+        'units': {
+            'ru': ([], np.empty((0, 2))),
+            'ua': ([], np.empty((0, 2)))
+        },
+        'frontline': [],
+        'areas': [],            
+        'areas_ua': []
+    }
+
+    # some checks
+    if content is None:
+        data['bad_data'] = True
+        return data
+
+    # open the kmz straight from the downloaded buffer
+    # and stream the doc.kml member into the parser
+    try:
+        with ZipFile(io.BytesIO(content)) as zf:
+            with zf.open('doc.kml') as f:
+                kml_root = parse_kml(f)
+    except (BadZipfile, KeyError):
+        print('bad zipfile')
+        data['bad_data'] = True
+        return data
+
+    # get styles
+    # as its redundent, we only need to get this from one kmz file
+    # get_styles(kml_root)
+
+    # index the document once, all extractors work on the index
+    kml_index = KmlIndex(kml_root)
+
+    # get units & count
+    unit_data = get_units_and_count(kml_index)
+    data['unit_count'] = unit_data['count']
+    data['units'] = unit_data['units']
+
+    # get frontline data
+    frontline_data = get_frontline(kml_index)
+    data['frontline'] = snapshot.Rings.from_list(frontline_data)
+
+    # get frontline area
+    frontline_areas = get_frontline_area(kml_index)
+    data['areas'] = snapshot.Rings.from_list(frontline_areas['ru'])
+    data['areas_ua'] = snapshot.Rings.from_list(frontline_areas['ua'])
+
+    # if latest dataset, get all:
+    # + geolocations
+    # + fortifications
+    # + styles
+    if item['is_latest']:
+        data['geolocations'] = get_geolocations(kml_index)
+        (fortifications, dragon_teeth) = get_fortifications(kml_index)
+        data['fortifications'] = fortifications
+        data['dragon_teeth'] = dragon_teeth
+        # get_styles(kml_root)
+
+    # fnally, return processed kmz data
+    return data
@@ -0,0 +1,57 @@
+import json
+
+import output
+
+# upstream manifest, what the days in ./data were built from
+#   {'files': {<upstream path>: {'date': <real data date>, 'sha': <git blob sha>,
+#                                'size': <bytes>, 'extractor': <extractor version>}}}
+# update() compares it to the current listing and redoes the dates with
+# new, republished or removed files, or with files from an older extractor.
+# dates whose files are all gone are left alone
+
+
+def entry(item, extractor_version):
+    return {
+        'date': item['real_data_date'],
+        'sha': item.get('sha'),
+        'size': item.get('size'),
+        'extractor': extractor_version
+    }
+
+
+def build(data_list, extractor_version):
+    return {'files': {item['path']: entry(item, extractor_version) for item in data_list}}
+
+
+def read(file_name):
+    try:
+        with open(file_name, encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def write(file_name, manifest):
+    output.write_json(file_name, manifest)
+
+
+def _dates(manifest):
+    return {entry['date'] for entry in manifest['files'].values()}
+
+
+def changed_dates(old, new):
+    # dates with new, republished or removed files, as long as there
+    # is still a file of that date to redo it from
+    dates = set()
+    for (path, new_entry) in new['files'].items():
+        if old['files'].get(path) != new_entry:
+            dates.add(new_entry['date'])
+    for (path, old_entry) in old['files'].items():
+        if path not in new['files']:
+            dates.add(old_entry['date'])
+    return dates & _dates(new)
+
+
+def removed_dates(old, new):
+    # dates without any file left, their days are kept as they are
+    return _dates(old) - _dates(new)
@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import geo
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# output writer
+# + files whose content did not change are not touched (no git churn)
+# + files are written to a temp file first and renamed into place,
+#   so a crash never leaves a half written file behind
+# + optionally writes precompressed siblings (<file>.gz / <file>.br),
+#   which devserver.py serves to clients accepting that encoding
+# + write_many() serializes & writes in a process pool
+
+SUFFIXES = {
+    'gzip': '.gz',
+    'br': '.br'
+}
+
+
+def parse_encodings(value):
+    # 'gzip,br' -> ['gzip', 'br'], brotli only if it is installed
+    encodings = []
+    for encoding in (value or '').split(','):
+        encoding = encoding.strip()
+        if not encoding:
+            continue
+        if encoding not in SUFFIXES:
+            raise ValueError(f'unknown output encoding: {encoding}')
+        if encoding == 'br' and brotli is None:
+            print('brotli is not installed, skipping .br output')
+            continue
+        encodings.append(encoding)
+    return encodings
+
+
+def compress(encoding, data):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output reproducible
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return brotli.compress(data, quality=11)
+
+
+def _unchanged(file_name, data):
+    try:
+        if os.path.getsize(file_name) != len(data):
+            return False
+        digest = hashlib.sha1()
+        with open(file_name, mode='rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.digest() == hashlib.sha1(data).digest()
+    except FileNotFoundError:
+        return False
+
+
+def _replace(file_name, data):
+    tmp_file_name = f'{file_name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_file_name, mode='wb') as f:
+            f.write(data)
+        os.replace(tmp_file_name, file_name)
+    finally:
+        if os.path.exists(tmp_file_name):
+            os.remove(tmp_file_name)
+
+
+def write_siblings(file_name, data, encodings, unchanged=False):
+    for encoding in encodings:
+        sibling = f'{file_name}{SUFFIXES[encoding]}'
+        if unchanged and os.path.exists(sibling):
+            continue
+        _replace(sibling, compress(encoding, data))
+
+
+def write_bytes(file_name, data, encodings=()):
+    # returns True if the file was (re)written
+    unchanged = _unchanged(file_name, data)
+    if not unchanged:
+        _replace(file_name, data)
+    write_siblings(file_name, data, encodings, unchanged)
+    return not unchanged
+
+
+def write_json(file_name, data, encodings=()):
+    text = json.dumps(data, default=geo.json_default,
+                      sort_keys=True, separators=(',', ':'))
+    return write_bytes(file_name, text.encode('utf-8'), encodings)
+
+
+def _write_job(job):
+    (file_name, data, encodings) = job
+    if isinstance(data, bytes):
+        return write_bytes(file_name, data, encodings)
+    return write_json(file_name, data, encodings)
+
+
+def write_many(jobs, workers=1):
+    # jobs: (file name, bytes or json data, encodings)
+    # returns the number of files which were (re)written
+    if workers <= 1 or len(jobs) < 2:
+        return sum(_write_job(job) for job in jobs)
+    # not forked, the caller may be running threads
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)),
+                             mp_context=multiprocessing.get_context('forkserver')) as executor:
+        return sum(executor.map(_write_job, jobs, chunksize=8))
@@ -0,0 +1,48 @@
+import numpy as np
+
+# google polyline algorithm, for any precision
+# every coordinate is quantized, delta encoded against the previous point,
+# zigzag encoded and written as 5-bit chunks (+63) into an ascii string.
+# both directions work on whole numpy arrays, there is no per value loop
+
+
+def encode(coords, precision=5):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(coords) == 0:
+        return ''
+    values = np.round(coords * 10 ** precision).astype(np.int64)
+    deltas = np.diff(values, axis=0, prepend=0).ravel()
+    zigzag = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+    # split every value into 5-bit chunks, lowest first
+    chunks = np.ones(len(zigzag), dtype=np.int64)
+    rest = zigzag >> np.uint64(5)
+    while rest.any():
+        chunks += rest > 0
+        rest >>= np.uint64(5)
+    shifts = np.arange(chunks.max(), dtype=np.uint64) * np.uint64(5)
+    groups = ((zigzag[:, None] >> shifts) & np.uint64(31)).astype(np.uint8)
+    positions = np.arange(len(shifts))
+    # all chunks but the last one of a value have the continuation bit set
+    groups[positions < (chunks[:, None] - 1)] |= 0x20
+    return (groups[positions < chunks[:, None]] + 63).tobytes().decode('ascii')
+
+
+def decode(text, precision=5):
+    if not text:
+        return np.empty((0, 2))
+    data = np.frombuffer(text.encode('ascii'), dtype=np.uint8) - 63
+    last = (data & 0x20) == 0
+    # index of the value every chunk belongs to & its position in there
+    value_index = np.concatenate(([0], np.cumsum(last[:-1])))
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    chunk_position = np.arange(len(data)) - starts[value_index]
+    parts = (data & 31).astype(np.uint64) << (chunk_position.astype(np.uint64) * np.uint64(5))
+    zigzag = np.add.reduceat(parts, starts)
+    deltas = (zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64)
+    values = np.cumsum(deltas.reshape(-1, 2), axis=0)
+    return values / 10 ** precision
+
+
+def encode_all(geometries, precision=5):
+    return [encode(geometry, precision) for geometry in geometries]
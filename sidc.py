@@ -1,5 +1,13 @@
+import functools
+import json
 import re
 
+import output
+
+# bump when a change to the rules below changes any sidc,
+# the memo of earlier runs is dropped then
+RULESET_VERSION = 1
+
 
 class SIDC:
     def __init__(self):
@@ -41,37 +49,69 @@ def check(unit_map):
         _ = _convert(unit)
 
 
-def update(unit_map):
+def update(unit_map, memo=None):
+    # memo: {(lowercased name, side): (sidc, custom text)} of earlier runs,
+    # only the units not in there are converted (and added to it)
     for (uid, unit) in unit_map.items():
-        (sidc_string, custom_text) = _convert(unit)
+        if memo is None:
+            (sidc_string, custom_text) = _convert(unit)
+        else:
+            # _convert only looks at the lowercased name & the side
+            key = (unit['n'].lower(), unit['s'])
+            if key not in memo:
+                memo[key] = _convert(unit)
+            (sidc_string, custom_text) = memo[key]
         unit_map[uid]['sidc'] = sidc_string
         if custom_text != '':
             unit_map[uid]['sidc_custom_text'] = custom_text
     return unit_map
 
 
+def load_memo(file_name):
+    # {'version': RULESET_VERSION, 'units': {side: {name: [sidc, custom text]}}}
+    try:
+        with open(file_name, encoding='utf-8') as fh:
+            data = json.load(fh)
+    except FileNotFoundError:
+        return {}
+    if data.get('version') != RULESET_VERSION:
+        return {}
+    return {(name, side): tuple(value)
+            for (side, names) in data['units'].items()
+            for (name, value) in names.items()}
+
+
+def save_memo(file_name, memo):
+    units = {}
+    for ((name, side), value) in memo.items():
+        units.setdefault(side, {})[name] = list(value)
+    output.write_json(file_name, {'version': RULESET_VERSION, 'units': units})
+
+
 def _convert(unit):
     fullname = unit['n']  # full unit name in map
     side = unit['s']  # ua|ru
     # fix some unit names, split into child/parent ect.
     (name, parent) = _prepare_unit_name(fullname)
+    # all rule keywords in the name, in one scan
+    (symbolset, amplifiers, set_b, custom_text, status) = _classify(tuple(KEYWORD_PATTERN.findall(name)))
     # init sidc
     sidc = SIDC()
     # SET A
     sidc.identity = _get_side(side)  # set identity
-    sidc.symbolset = _get_symbol_set(name)  # set symbol set
-    sidc.amplifiers = _get_amplifiers(name, parent)  # set amplifier
+    sidc.symbolset = symbolset  # set symbol set
+    sidc.amplifiers = _fix_amplifiers(name, parent, amplifiers)  # set amplifier
     # SET B
-    (entity, entity_type, entity_subtype, modifier1, modifier2) = _get_set_b(name, sidc.symbolset)
+    (entity, entity_type, entity_subtype, modifier1, modifier2) = set_b
     sidc.entity = entity
     sidc.entity_type = entity_type
     sidc.entity_subtype = entity_subtype
     sidc.modifier1 = modifier1
     sidc.modifier2 = modifier2
     # set custom text
-    sidc.custom_text = _get_custom_text(name)
+    sidc.custom_text = custom_text
     # set status
-    sidc.status = _get_status(name)
+    sidc.status = status
     # if sidc.custom_text != '':
     #     print(f'{name} - {sidc.custom_text}')
 
@@ -131,700 +171,484 @@ def _get_side(side):
     return '00' # unknown
 
 
-def _get_symbol_set(name):
-    # relevant symbol sets are:
-    # air, land unit, land installations
-    # sea surface, sea subsurface
-    symbolsets = {
-        'unknown': '00',
-        'air': '01',
-        'land_unit': '10',
-        'land_installation': '20',
-        'sea_surface': '30',
-        'sea_subsurface': '35'
-    }
-
-    # Note: default is land unit
-    symbol_set = '10'  # land unit
-
-    # to fix some potential false positives
-    # we use some hard checks
-
+# rule tables
+# every rule is a 'keyword in name' check. the rows of a table are in
+# priority order: (keywords, value), the first row with one of its
+# keywords in the name wins. all keywords of all tables are found in a
+# single scan of the name (see _hits), the tables then only look them up
+
+
+class Rules:
+    __slots__ = ('index',)
+
+    def __init__(self, rows):
+        # keyword -> (priority, value) of the first row it is in
+        self.index = {}
+        for (priority, (keywords, value)) in enumerate(rows):
+            for keyword in keywords:
+                self.index.setdefault(keyword, (priority, value))
+
+    def first(self, hits, default=None):
+        # value of the first row with a hit
+        best = None
+        for keyword in hits:
+            entry = self.index.get(keyword)
+            if entry is not None and (best is None or entry[0] < best[0]):
+                best = entry
+        return default if best is None else best[1]
+
+
+# relevant symbol sets are:
+# air, land unit, land installations
+# sea surface, sea subsurface
+SYMBOL_SETS = {
+    'unknown': '00',
+    'air': '01',
+    'land_unit': '10',
+    'land_installation': '20',
+    'sea_surface': '30',
+    'sea_subsurface': '35'
+}
+
+# to fix some potential false positives, the hard checks come first.
+# the default is land unit
+SYMBOL_SET_RULES = Rules([
     # all uav units -> land units
-    checkwords = ['[uav]']
-    for checkword in checkwords:
-        if checkword in name:
-            return symbolsets['land_unit']
-
+    (['[uav]'], SYMBOL_SETS['land_unit']),
     # all air bases/fields -> land installation
-    checkwords = ['air base', 'airbase', 'air field', 'airfield', 'military base',
-                  'command post', 'testing centre', 'aviation center', 'training center']
-    for checkword in checkwords:
-        if checkword in name:
-            return symbolsets['land_installation']
-
-    # all anti-aircraft units -> land installation
-    checkwords = ['anti-aircraft']
-    for checkword in checkwords:
-        if checkword in name:
-            return symbolsets['land_unit']
-
+    (['air base', 'airbase', 'air field', 'airfield', 'military base',
+      'command post', 'testing centre', 'aviation center', 'training center'], SYMBOL_SETS['land_installation']),
+    # all anti-aircraft units -> land units
+    (['anti-aircraft'], SYMBOL_SETS['land_unit']),
     # anti-submarine units -> air
-    checkwords = ['anti-submarine helicopter', 'anti-submarine aviation']
-    for checkword in checkwords:
-        if checkword in name:
-            return symbolsets['air']
-
+    (['anti-submarine helicopter', 'anti-submarine aviation'], SYMBOL_SETS['air']),
     # sea subsurface
-    checkwords = ['submarine']
-    for checkword in checkwords:
-        if checkword in name:
-            return symbolsets['sea_subsurface']
-
-    # air
-    # must be chekced before sea surface units
-    checkwords = ['aviation', 'helicopter', 'aircraft', 'a-50', 'su-25']
-    for checkword in checkwords:
-        if checkword in name:
-            return symbolsets['air']
-
+    (['submarine'], SYMBOL_SETS['sea_subsurface']),
+    # air, must be checked before sea surface units
+    (['aviation', 'helicopter', 'aircraft', 'a-50', 'su-25'], SYMBOL_SETS['air']),
     # sea surface
-    checkwords = [
-        'minesweeper',
-        'ship',
-        'corvette',
-        'tanker',
-        'frigate',
-        'boat',
-        'cruiser',
-        'flotilla',
-        'oiler',
-        'buyan-m'
-    ]
-    for checkword in checkwords:
-        if checkword in name:
-            return symbolsets['sea_surface']
-
-    return symbol_set
-
-
-def _get_amplifiers(name, parent):
-    amplifier1 = '0'  # unknown
-    amplifier2 = '0'  # unknown
-
-    # ==================================================
-    # amplifier1
-    # ==================================================
-    # for us only the following values are relevant:
-    # 0 - Unknown
-    # 1 - Echelon at brigade and below
-    # 2 - Echelon at division and above
-    checkwords1 = ['army group', 'army', 'corps', 'division']
-    checkwords2 = ['brigade', 'regiment',
-                   'battalion', 'squadron', 'company', 'detachment']
-    # we test smaller unit sizes first
-    for checkword in checkwords2:
-        if checkword in name:
-            amplifier1 = '1'
-            break
-    # now check all unit which are still unknown
-    if amplifier1 == '0':
-        for checkword in checkwords1:
-            if checkword in name:
-                amplifier1 = '2'
-                break
-    # some units or unit types are still 'unknown' at first point
-    # mostly drone groups, sbu & sso groups and all the other obscure ones
-    # we leave them as unknown
-    # a few other groups we set manually:
-    if amplifier1 == '0':
-        exceptions = ['bars', '[omon]', '[pmc]', 'pmc', 'wagner group']
-        for checkword in exceptions:
-            if checkword in name:
-                amplifier1 = '1'
-                break
-
-    # ==================================================
-    # amplifier2
-    # ==================================================
-    # based on amplifier1 we now do the fine tuning
-    dict1 = {'brigade': '8', 'regiment': '7', 'battalion': '6', 'squadron': '6',
-             'company': '5', 'detachment': '4'}
-    dict2 = {'army group': '4', 'army corps': '2', 'army': '3', 'corps': '2', 'division': '1'}
-
-    if amplifier1 == '1':
-        for checkword, key in dict1.items():
-            if checkword in name:
-                amplifier2 = key
-                break
-
-    if amplifier1 == '2':
-        for checkword, key in dict2.items():
-            if checkword in name:
-                amplifier2 = key
-                break
-
-    # exceptions & fixes
-    # bars & omon units -> battalion
-    exceptions = ['bars', '[omon]', '[pmc]', 'pmc']
-    for checkword in exceptions:
-        if checkword in name:
-            amplifier2 = dict1['battalion']
-            break
-    # wagner group - was a brigade
-    if 'wagner group' in name:
-        amplifier2 = dict1['brigade']
+    (['minesweeper', 'ship', 'corvette', 'tanker', 'frigate', 'boat',
+      'cruiser', 'flotilla', 'oiler', 'buyan-m'], SYMBOL_SETS['sea_surface'])
+])
+
+# amplifier1, for us only the following values are relevant:
+# 0 - Unknown
+# 1 - Echelon at brigade and below
+# 2 - Echelon at division and above
+# smaller unit sizes first. some units or unit types stay unknown,
+# mostly drone groups, sbu & sso groups and all the other obscure ones,
+# a few other groups are set manually (last row)
+AMPLIFIER1_RULES = Rules([
+    (['brigade', 'regiment', 'battalion', 'squadron', 'company', 'detachment'], '1'),
+    (['army group', 'army', 'corps', 'division'], '2'),
+    (['bars', '[omon]', '[pmc]', 'pmc', 'wagner group'], '1')
+])
+
+# amplifier2, based on amplifier1
+AMPLIFIER2_RULES = {
+    '1': Rules([
+        (['brigade'], '8'),
+        (['regiment'], '7'),
+        (['battalion'], '6'),
+        (['squadron'], '6'),
+        (['company'], '5'),
+        (['detachment'], '4')
+    ]),
+    '2': Rules([
+        (['army group'], '4'),
+        (['army corps'], '2'),
+        (['army'], '3'),
+        (['corps'], '2'),
+        (['division'], '1')
+    ])
+}
+
+# exceptions & fixes of amplifier2, in this order:
+# bars & omon units -> battalion, wagner group - was a brigade
+AMPLIFIER2_FIXES = [
+    (['bars', '[omon]', '[pmc]', 'pmc'], '6'),
+    (['wagner group'], '8')
+]
+
+FAKE_CORPS = ['freikorps volunteer corps', 'russian volunteer corps', 'muslim corps kavkaz', 'polish volunteer corps']
+
+# sea subsurface
+SEA_SUBSURFACE_TYPE_RULES = Rules([
+    (['submarine'], '01')
+])
+SEA_SUBSURFACE_MODIFIER_RULES = Rules([
+    # attack, diesel electric (general)
+    (['kilo class'], ('08', '02'))
+])
+
+# sea surface: type -> entity => subtype tables, (entity, entity type, rows).
+# unlike the other tables, a later table with a hit overrides an earlier one
+SEA_SURFACE_TYPE_RULES = [
+    # military combatant -> surface
+    ('12', '02', Rules([
+        (['corvette'], '05'),
+        (['frigate'], '04'),
+        (['destroyer'], '03'),
+        (['cruiser'], '02'),
+        (['buyan-m'], '05')
+    ])),
+    # military combatant -> amphibious warefare
+    ('12', '03', Rules([
+        (['landing ship'], '07'),
+        (['ropucha'], '07')
+    ])),
+    # military combatant -> mine warfare
+    ('12', '04', Rules([
+        (['minesweeper'], '02')
+    ])),
+    # military combatant -> patrol boat
+    ('12', '05', Rules([
+        (['patrol'], '02')
+    ])),
+    # military non combatant -> auxiliary
+    ('13', '01', Rules([
+        (['oiler'], '10'),
+        (['tanker'], '10'),
+        (['intelligence'], '04')
+    ]))
+]
+
+# exceptions, override the tables above
+SEA_SURFACE_TYPE_FIXES = Rules([
+    # patrol boats, general
+    (['dnieper river flotilla'], ('12', '05', '02'))
+])
+
+# modifiers
+SEA_SURFACE_MODIFIERS1 = {
+    'Antiair Warfare': '02',
+    'Antisubmarine Warfare': '03',
+    'Escort': '04',
+    'Electronic Warfare': '05',
+    'Intelligence, Surveillance, Reconnaissance': '06',
+    'Mine Countermeasures': '07',
+    'Missile Defense': '08',
+    'Medical': '09',
+    'Mine Warfare': '10',
+    'Remote Multi-Mission Vehicle (USV only)': '11',
+    'Special Operations Forces (SOF)': '12',
+    'Surface Warfare': '13',
+    'Ballistic Missile': '14',
+    'Guided Missile': '15',
+    'Other Guided Missile': '16',
+    'Torpedo': '17',
+    'Drone-Equipped': '18',
+    'Helicopter-Equipped/VSTOL': '19',
+}
+SEA_SURFACE_MODIFIER1_RULES = Rules([
+    (['guided missile'], SEA_SURFACE_MODIFIERS1['Guided Missile']),
+    (['karakurt'], SEA_SURFACE_MODIFIERS1['Guided Missile']),
+    (['askold', 'tsiklon'], SEA_SURFACE_MODIFIERS1['Guided Missile']),
+    (['tarantul'], SEA_SURFACE_MODIFIERS1['Other Guided Missile']),
+    (['steregushchiy'], SEA_SURFACE_MODIFIERS1['Guided Missile']),
+    (['orekhovo-zuyevo'], SEA_SURFACE_MODIFIERS1['Guided Missile']),
+    (['asw'], SEA_SURFACE_MODIFIERS1['Antisubmarine Warfare']),
+    (['minesweeper'], SEA_SURFACE_MODIFIERS1['Mine Countermeasures']),
+    (['intelligence'], SEA_SURFACE_MODIFIERS1['Intelligence, Surveillance, Reconnaissance']),
+    (['tanker'], SEA_SURFACE_MODIFIERS1['Intelligence, Surveillance, Reconnaissance'])
+])
+
+# land installations, a later table with a hit overrides an earlier one
+LAND_INSTALLATION_TYPE_RULES = [
+    # infrastructure -> military
+    ('12', '08', Rules([
+        (['training center'], '02'),
+        (['military base'], '02'),
+        (['aviation center'], '02'),
+        (['testing centre'], '02'),
+        (['command post'], '02')
+    ])),
+    # infrastructure -> transportation
+    ('12', '13', Rules([
+        (['airbase'], '01'),
+        (['air base'], '01'),
+        (['airfield'], '01'),
+        (['air field'], '01')
+    ]))
+]
+
+# air, a later table with a hit overrides an earlier one
+AIR_TYPE_RULES = [
+    # military -> fixed wing
+    ('11', '01', Rules([
+        (['mixed'], '05'),
+        (['bomber'], '03'),
+        (['fighter'], '04'),
+        (['tanker'], '09'),
+        (['transport'], '07'),
+        (['assault'], '02'),
+        (['reconnaissance'], '11'),
+        (['training'], '12'),
+        (['combat control'], '15'),
+        (['a-50'], '16'),
+        (['su-25'], '04'),
+        (['army aviation'], '00'),
+        (['tactical aviation'], '00'),
+        (['naval attack'], '18'),  # we use anti-submarine here
+        (['early warning'], '16'),
+        (['anti-submarine'], '18')
+    ])),
+    # military -> rotary wing
+    ('11', '02', Rules([
+        (['helicopter'], '00')
+    ]))
+]
+
+# land units: basic (entity, entity type)
+LAND_UNIT_RULES = Rules([
+    (['infantry'], ('12', '11')),
+    (['[uav]', 'drone', 'uav'], ('12', '19')),
+    (['air assault'], ('12', '11')),  # infantry
+    (['mountain assault'], ('12', '11')),  # infantry
+    (['tank'], ('12', '05')),
+    (['air defense', 'air defence'], ('13', '01')),  # fires
+    (['missile', 'rocket'], ('13', '07')),  # fires
+    (['sof'], ('12', '18')),
+    (['sbu'], ('12', '18')),  # SOF
+    (['sso'], ('12', '18')),  # SOF
+    (['mechanized', 'mechanised'], ('12', '11')),  # infantry
+    (['engineering', 'engineer'], ('14', '07')),  # protection, engineer
+    (['support', 'pontoon'], ('14', '07')),  # protection, engineer
+    (['artillery'], ('13', '03')),  # fires
+    (['army corps'], ('12', '10')),
+    (['combined arms'], ('12', '10')),
+    (['[np]'], ('20', '07')),  # law enforcement
+    (['border guard'], ('20', '02')),  # law enforcement
+    (['rifle'], ('12', '11')),
+    (['anti-aircraft missile'], ('13', '01')),  # fires
+    (['anti-aircraft'], ('13', '01')),  # fires
+    (['[ng]'], ('14', '17')),  # protection, security. or is movement->infantry better?
+    (['omon'], ('14', '00')),  # protection, we use custom text
+    (['bars'], ('12', '00')),  # we use custom text
+    (['territorial defense brigade'], ('12', '11')),
+    (['tdf'], ('12', '11')),
+    (['airborne'], ('12', '11')),
+    (['motorized'], ('12', '11')),
+    (['cbrn'], ('14', '01')),  # protection
+    (['nbc'], ('14', '01')),  # protection
+    (['[territorial]'], ('12', '11')),
+    (['[pmc]', 'pmc'], ('12', '00')),  # we use custom text
+    (['[vol]', 'volunteer'], ('12', '00')),  # we use custom text
+    (['signal'], ('11', '10')),  # command & control, signal
+    (['railway'], ('16', '36')),  # sustainment, transportation
+    (['logistics', 'logistic'], ('16', '02')),  # sustainment, all classes of supply
+    (['reconnaissance', 'reconnaisse', 'recon'], ('12', '13')),
+    (['electronic warfare'], ('15', '05')),  # intelligence, electronic warfare
+    (['communications'], ('11', '10')),  # command & control, signal
+    (['spetsnaz'], ('12', '11')),
+    (['marine'], ('12', '11')),
+    (['jager'], ('12', '11')),
+    (['combined'], ('12', '10')),
+    (['[dpr]', '[lpr]'], ('12', '11')),
+    (['wagner group'], ('12', '10')),
+    (['special purpose'], ('12', '17')),  # special forces, not ideal
+    (['regiment'], ('12', '11')),  # should be last, as a catch all
+    (['battalion'], ('12', '11'))  # should be last, as a catch all
+])
+# the catch all after the table: units without any of the keywords above
+# end up as infantry (the old if/elif chain ended with an always true
+# `elif "assault":`, the sidcs we have published rely on that)
+LAND_UNIT_DEFAULT = ('12', '11')
+
+# subtypes of infantry
+LAND_UNIT_INFANTRY_SUBTYPE_RULES = Rules([
+    (['motorized'], '04'),
+    (['mechanized'], '02'),
+    (['coastal defense'], '05')
+])
+LAND_UNIT_MODIFIER1_RULES = Rules([
+    (['marine', 'naval'], '46')  # naval
+])
+LAND_UNIT_MODIFIER2_RULES = Rules([
+    (['mountain'], '27'),
+    (['airmobile', 'air asault'], '01')
+])
+
+CUSTOM_TEXT_RULES = Rules([
+    (['bars'], 'BARS'),
+    (['[omon]'], 'OMON'),
+    (['omon'], 'OMON'),
+    (['[pmc]'], 'PMC'),
+    (['pmc'], 'PMC'),
+    (['wagner group'], 'PMC'),
+    (['[vol]'], 'VOL'),
+    (['volunteer'], 'VOL')
+])
+
+DESTROYED = ['Moskva', 'Ondatra', 'Ivanovets', 'Minsk', 'Rostov na Donu', 'Cesar Kunikov', 'Novocherkassk', 'Sergey Kotov',
+             'Askold', 'Saratov', 'A-50 AEWC RF-93966 / 37 Red', 'A-50U AEWC RF-50610 / 42-Red']
+STATUS_RULES = Rules([
+    ([checkword.lower() for checkword in DESTROYED], 4)
+])
+
+
+def _rule_keywords():
+    tables = [SYMBOL_SET_RULES, AMPLIFIER1_RULES, SEA_SUBSURFACE_TYPE_RULES,
+              SEA_SUBSURFACE_MODIFIER_RULES, SEA_SURFACE_TYPE_FIXES, SEA_SURFACE_MODIFIER1_RULES, LAND_UNIT_RULES,
+              LAND_UNIT_INFANTRY_SUBTYPE_RULES, LAND_UNIT_MODIFIER1_RULES, LAND_UNIT_MODIFIER2_RULES,
+              CUSTOM_TEXT_RULES, STATUS_RULES]
+    tables.extend(AMPLIFIER2_RULES.values())
+    for type_rules in [SEA_SURFACE_TYPE_RULES, LAND_INSTALLATION_TYPE_RULES, AIR_TYPE_RULES]:
+        tables.extend(rules for (_, _, rules) in type_rules)
+    keywords = {keyword for rules in tables for keyword in rules.index}
+    keywords.update(keyword for (keywords, _) in AMPLIFIER2_FIXES for keyword in keywords)
+    return keywords
+
+
+def _trie_pattern(node):
+    # regex of a keyword trie, the branches of a node start with different
+    # characters and are tried before the keyword ending at the node,
+    # so it matches the longest keyword starting at a position
+    branches = [re.escape(char) + _trie_pattern(child)
+                for (char, child) in sorted(node.items()) if char != '']
+    if not branches:
+        return ''
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        pattern = f'(?:{pattern})?'
+    return pattern
+
+
+def _keyword_pattern(keywords):
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return re.compile(f'(?=({_trie_pattern(trie)}))')
+
+
+KEYWORDS = _rule_keywords()
+# at every position of the name the lookahead finds the longest keyword
+# starting there, all shorter ones starting there are prefixes of it.
+# so the keywords contained in the matched ones are all the keywords of the name
+KEYWORD_PATTERN = _keyword_pattern(KEYWORDS)
+KEYWORDS_IN = {keyword: frozenset(k for k in KEYWORDS if k in keyword) for keyword in KEYWORDS}
+
+
+def _hits(matches):
+    # all keywords in the name, from the KEYWORD_PATTERN matches
+    hits = set()
+    for keyword in set(matches):
+        hits |= KEYWORDS_IN[keyword]
+    return hits
+
+
+@functools.lru_cache(maxsize=4096)
+def _classify(matches):
+    # everything except what depends on the parent / the exact name,
+    # only depends on the keywords, so the decisions are cached by them
+    hits = _hits(matches)
+    symbolset = _get_symbol_set(hits)
+    return (symbolset, _get_amplifiers(hits), _get_set_b(hits, symbolset),
+            _get_custom_text(hits), _get_status(hits))
+
+
+def _last_type(hits, type_rules, default):
+    # (entity, entity type, entity subtype) of the last table with a hit
+    result = default
+    for (entity, entity_type, rules) in type_rules:
+        entity_subtype = rules.first(hits)
+        if entity_subtype is not None:
+            result = (entity, entity_type, entity_subtype)
+    return result
+
+
+def _get_symbol_set(hits):
+    return SYMBOL_SET_RULES.first(hits, SYMBOL_SETS['land_unit'])
+
+
+def _get_amplifiers(hits):
+    amplifier1 = AMPLIFIER1_RULES.first(hits, '0')
+    amplifier2 = '0'
+    if amplifier1 in AMPLIFIER2_RULES:
+        amplifier2 = AMPLIFIER2_RULES[amplifier1].first(hits, '0')
+    for (keywords, value) in AMPLIFIER2_FIXES:
+        if not hits.isdisjoint(keywords):
+            amplifier2 = value
+    return (amplifier1, amplifier2)
+
+
+def _fix_amplifiers(name, parent, amplifiers):
+    (amplifier1, amplifier2) = amplifiers
     # if amplifier2 is below that of the parent
     # example: 64th artillery division |of| 406th artillery brigade
     # here 'division' is actually 'divizion' aka battalion
     if parent is not None:
         if 'brigade' in parent and amplifier2 == '1':
             amplifier1 = '1'
-            amplifier2 = dict1['battalion']
-    fake_corps = ['freikorps volunteer corps', 'russian volunteer corps', 'muslim corps kavkaz', 'polish volunteer corps']
-    if amplifier2 == '2':
-        for checkword in fake_corps:
-            if name == checkword:
-                amplifier1 = '1'
-                amplifier2 = '0'
-
-    # if parent is not None:
-    #     print(f'{name} -> {parent} => {amplifier1} - {amplifier2}')
+            amplifier2 = '6'
+    if amplifier2 == '2' and name in FAKE_CORPS:
+        amplifier1 = '1'
+        amplifier2 = '0'
 
     return f'{amplifier1}{amplifier2}'
 
 
-def _get_set_b(name, symbolset):
+def _get_set_b(hits, symbolset):
     # based on symbol set
-
-    # defaults
-    entity = '00'
-    entity_type = '00'
-    entity_subtype = '00'
-    modifier1 = '00'
-    modifier2 = '00'
-
-
-    if symbolset == '01': # air
-        (entity, entity_type, entity_subtype, modifier1, modifier2) = _get_set_b_air(name)
-    elif symbolset == '10': # land unit
-        (entity, entity_type, entity_subtype, modifier1, modifier2) = _get_set_b_land_unit(name)
-    elif symbolset == '20': # land installations
-        (entity, entity_type, entity_subtype, modifier1, modifier2) = _get_set_b_land_installation(name)
-    elif symbolset == '30': # sea surface
-        (entity, entity_type, entity_subtype, modifier1, modifier2) = _get_set_b_sea_surface(name)
-    elif symbolset == '35': # sea subsurface
-        (entity, entity_type, entity_subtype, modifier1, modifier2) = _get_set_b_sea_subsurface(name)
-
-    # final return
-    return (entity, entity_type, entity_subtype, modifier1, modifier2)
-
-def _get_set_b_sea_subsurface(name):
-    # defaults
-    entity = '11' # we assume every unit is of military type
-    entity_type = '00'
-    entity_subtype = '00' # only for submarines (submerged, surfaced ect.) - we can ignore it
-    modifier1 = '00'
-    modifier2 = '00'
-    # entity type
-    if 'submarine' in name:
-        entity_type = '01'
-    # modifier1
-    if 'kilo class' in name:
-        modifier1 = '08' # attack
-        modifier2 = '02' # diesel electric, general
-    # return
-    set_b = (entity, entity_type, entity_subtype, modifier1, modifier2)
-    # print(f'{name} -> {set_b}')
-    return set_b
-
-def _get_set_b_sea_surface(name):
-    # defaults
-    entity = '12' # default: military combatant type
-    entity_type = '00'
+    if symbolset == SYMBOL_SETS['air']:
+        return _get_set_b_air(hits)
+    if symbolset == SYMBOL_SETS['land_unit']:
+        return _get_set_b_land_unit(hits)
+    if symbolset == SYMBOL_SETS['land_installation']:
+        return _get_set_b_land_installation(hits)
+    if symbolset == SYMBOL_SETS['sea_surface']:
+        return _get_set_b_sea_surface(hits)
+    if symbolset == SYMBOL_SETS['sea_subsurface']:
+        return _get_set_b_sea_subsurface(hits)
+    return ('00', '00', '00', '00', '00')
+
+
+def _get_set_b_sea_subsurface(hits):
+    # we assume every unit is of military type, the subtype is only
+    # for submarines (submerged, surfaced ect.) - we can ignore it
+    entity_type = SEA_SUBSURFACE_TYPE_RULES.first(hits, '00')
+    (modifier1, modifier2) = SEA_SUBSURFACE_MODIFIER_RULES.first(hits, ('00', '00'))
+    return ('11', entity_type, '00', modifier1, modifier2)
+
+
+def _get_set_b_sea_surface(hits):
+    # default: military combatant type
+    (entity, entity_type, entity_subtype) = _last_type(hits, SEA_SURFACE_TYPE_RULES, ('12', '00', '00'))
+    (entity, entity_type, entity_subtype) = SEA_SURFACE_TYPE_FIXES.first(hits,
+                                                   (entity, entity_type, entity_subtype))
+    modifier1 = SEA_SURFACE_MODIFIER1_RULES.first(hits, '00')
+    return (entity, entity_type, entity_subtype, modifier1, '00')
+
+
+def _get_set_b_land_installation(hits):
+    # default: infrastructure
+    (entity, entity_type, entity_subtype) = _last_type(hits, LAND_INSTALLATION_TYPE_RULES, ('12', '00', '00'))
+    return (entity, entity_type, entity_subtype, '00', '00')
+
+
+def _get_set_b_air(hits):
+    # default: military
+    (entity, entity_type, entity_subtype) = _last_type(hits, AIR_TYPE_RULES, ('11', '00', '00'))
+    return (entity, entity_type, entity_subtype, '00', '00')
+
+
+def _get_set_b_land_unit(hits):
+    (entity, entity_type) = LAND_UNIT_RULES.first(hits, LAND_UNIT_DEFAULT)
     entity_subtype = '00'
-    modifier1 = '00'
-    modifier2 = '00' # we don't need it
-
-    # type->entity => subtype dicts
-    military_combatant__surface = {
-        'corvette': '05',
-        'frigate': '04',
-        'destroyer': '03',
-        'cruiser': '02',
-        'buyan-m': '05'
-    }
-    military_combatant__amphibious = {
-        'landing ship': '07',
-        'ropucha': '07'
-    }
-    military_combatant__mine_warefare = {
-        'minesweeper': '02'
-    }
-    military_combatant__patrol_boat = {
-        'patrol': '02'
-    }
-    military_non_combatant__auxiliary = {
-        'oiler': '10',
-        'tanker': '10',
-        'intelligence': '04'
-    }
-
-    # entity type
-    # military combatant -> surface
-    for checkword, key in military_combatant__surface.items():
-        if checkword in name:
-            entity = '12'
-            entity_type = '02'
-            entity_subtype = key
-            break
-    # military combatant -> amphibious warefare
-    for checkword, key in military_combatant__amphibious.items():
-        if checkword in name:
-            entity = '12'
-            entity_type = '03'
-            entity_subtype = key
-            break
-    # military combatant -> mine warfare
-    for checkword, key in military_combatant__mine_warefare.items():
-        if checkword in name:
-            entity = '12'
-            entity_type = '04'
-            entity_subtype = key
-            break
-    # military combatant -> patrol boat
-    for checkword, key in military_combatant__patrol_boat.items():
-        if checkword in name:
-            entity = '12'
-            entity_type = '05'
-            entity_subtype = key
-            break
-    # military non combatant -> auxiliary
-    for checkword, key in military_non_combatant__auxiliary.items():
-        if checkword in name:
-            entity = '13'
-            entity_type = '01'
-            entity_subtype = key
-            break
-
-    # exceptions
-    if 'dnieper river flotilla' in name:
-        entity = '12'
-        entity_type = '05' # patrol boats
-        entity_subtype = '02' # general
-
-    # modifiers
-    modifiers1 = {
-        'Antiair Warfare': '02',
-        'Antisubmarine Warfare': '03',
-        'Escort': '04',
-        'Electronic Warfare': '05',
-        'Intelligence, Surveillance, Reconnaissance': '06',
-        'Mine Countermeasures': '07',
-        'Missile Defense': '08',
-        'Medical': '09',
-        'Mine Warfare': '10',
-        'Remote Multi-Mission Vehicle (USV only)': '11',
-        'Special Operations Forces (SOF)': '12',
-        'Surface Warfare': '13',
-        'Ballistic Missile': '14',
-        'Guided Missile': '15',
-        'Other Guided Missile': '16',
-        'Torpedo': '17',
-        'Drone-Equipped': '18',
-        'Helicopter-Equipped/VSTOL': '19',
-    }
-
-    # modifier1
-    if 'guided missile' in name:
-        modifier1 = modifiers1['Guided Missile']
-    elif 'karakurt' in name:
-        modifier1 = modifiers1['Guided Missile']
-    elif 'askold' in name or 'tsiklon' in name:
-        modifier1 = modifiers1['Guided Missile']
-    elif 'tarantul' in name:
-        modifier1 = modifiers1['Other Guided Missile']
-    elif 'steregushchiy' in name:
-        modifier1 = modifiers1['Guided Missile']
-    elif 'orekhovo-zuyevo' in name:
-        modifier1 = modifiers1['Guided Missile']
-    elif 'asw' in name:
-        modifier1 = modifiers1['Antisubmarine Warfare']
-    elif 'minesweeper' in name:
-        modifier1 = modifiers1['Mine Countermeasures']
-    elif 'intelligence' in name:
-        modifier1 = modifiers1['Intelligence, Surveillance, Reconnaissance']
-    elif 'tanker' in name:
-        modifier1 = modifiers1['Intelligence, Surveillance, Reconnaissance']
-
-    # if modifier1 == '00' and 'landing ship' not in name and 'patrol' not in name:
-    #     print(name)
-
-    # if entity_type == '00':
-    #     print(name)
-
-    set_b = (entity, entity_type, entity_subtype, modifier1, modifier2)
-    # print(f'{name} -> {set_b}')
-    return set_b
-
-def _get_set_b_land_installation(name):
-    # defaults
-    entity = '12' # default: infrastructure
-    entity_type = '00'
-    entity_subtype = '00'
-    modifier1 = '00'
-    modifier2 = '00'
-
-    # type->entity => subtype dicts
-    infrastructure__military = {
-        'training center': '02',
-        'military base': '02',
-        'aviation center': '02',
-        'testing centre': '02',
-        'command post': '02'
-    }
-    infrastructure__transportation = {
-        'airbase': '01',
-        'air base': '01',
-        'airfield': '01',
-        'air field': '01',
-    }
-
-    # infrastructure__military
-    for checkword, key in infrastructure__military.items():
-        if checkword in name:
-            entity = '12'
-            entity_type = '08'
-            entity_subtype = key
-            break
-    # infrastructure__transportation
-    for checkword, key in infrastructure__transportation.items():
-        if checkword in name:
-            entity = '12'
-            entity_type = '13'
-            entity_subtype = key
-            break
-
-    # if entity_type == '00':
-    #     print(name)
-
-    set_b = (entity, entity_type, entity_subtype, modifier1, modifier2)
-    # print(f'{name} -> {set_b}')
-    return set_b
-
-def _get_set_b_air(name):
-    # defaults
-    entity = '11' # default: military
-    entity_type = '00'
-    entity_subtype = '00'
-    modifier1 = '00'
-    modifier2 = '00' # we don't need it
-
-    # type->entity => subtype dicts
-    military__fixed_wing = {
-        'mixed': '05',
-        'bomber': '03',
-        'fighter': '04',
-        'tanker': '09',
-        'transport': '07',
-        'assault': '02',
-        'reconnaissance': '11',
-        'training': '12',
-        'combat control': '15',
-        'a-50': '16',
-        'su-25': '04',
-        'army aviation': '00',
-        'tactical aviation': '00',
-        'naval attack': '18', # we use anti-submarine here
-        'early warning': '16',
-        'anti-submarine': '18'
-    }
-    military__rotary_wing = {
-        'helicopter': '00'
-    }
-
-    # military__fixed_wing
-    for checkword, key in military__fixed_wing.items():
-        if checkword in name:
-            entity = '11'
-            entity_type = '01'
-            entity_subtype = key
-            break
-    # military__rotary_wing
-    for checkword, key in military__rotary_wing.items():
-        if checkword in name:
-            entity = '11'
-            entity_type = '02'
-            entity_subtype = key
-            break
-
-    # elif 'assault' in name:
-    #     modifier1 = '01'
-    # modifier1 - we don't use them for now
-    # if 'mixed' in name:
-    #     modifier1 = '01'
-    # elif 'bomber' in name:
-    #     modifier1 = '02'
-    # elif 'fighter' in name:
-    #     modifier1 = '04'
-    # elif 'tanker' in name:
-    #     modifier1 = '06'
-    # elif 'transport' in name:
-    #     modifier1 = '03' # we use 'cargo' here
-    # elif 'assault' in name:
-    #     modifier1 = '01'
-    # elif 'reconnaissance' in name:
-    #     modifier1 = '18'
-    # elif 'training' in name:
-    #     modifier1 = '19'
-    # elif 'combat control' in name:
-    #     modifier1 = '11' # we use 'command post' here
-    # elif 'a-50' in name:
-    #     modifier1 = '12'
-    # elif 'su-25' in name:
-    #     modifier1 = '04' # we use 'fighter' here
-    # elif 'asw' in name:
-    #     modifier1 = '22'
-    # elif 'submarine' in name:
-    #     modifier1 = '22'
-    # elif 'attack' in name:
-    #     modifier1 = '01'
-    # elif 'early warning' in name:
-    #     modifier1 = '12'
-
-    set_b = (entity, entity_type, entity_subtype, modifier1, modifier2)
-    # print(f'{name} -> {set_b}')
-    return set_b
-
-def _get_set_b_land_unit(name):
-    # defaults
-    entity = '12' # default: movement & maneuver
-    entity_type = '00'
-    entity_subtype = '00'
-    modifier1 = '00'
-    modifier2 = '00'
-
-
-    # basic entity and entity type
-    if 'infantry' in name:
-        entity = '12'
-        entity_type = '11'
-    elif '[uav]' in name or 'drone' in name or 'uav' in name:
-        entity = '12'
-        entity_type = '19'
-    elif 'air assault' in name:
-        entity = '12'
-        entity_type = '11' # infantry
-    elif 'mountain assault' in name:
-        entity = '12'
-        entity_type = '11' # infantry        
-    elif 'tank' in name:
-        entity = '12'
-        entity_type = '05'
-    elif 'air defense' in name or 'air defence' in name:
-        entity = '13' # fires
-        entity_type = '01'
-    elif 'missile' in name or 'rocket' in name:
-        entity = '13' # fires
-        entity_type = '07'
-    elif 'sof' in name:
-        entity = '12'
-        entity_type = '18'
-    elif 'sbu' in name:
-        entity = '12'
-        entity_type = '18' #SOF
-    elif 'sso' in name:
-        entity = '12'
-        entity_type = '18' #SOF
-    elif 'mechanized' in name or 'mechanised' in name:
-        entity = '12'
-        entity_type = '11' # infantry
-    elif 'engineering' in name or 'engineer' in name:
-        entity = '14' # protection
-        entity_type = '07' # engineer
-    elif 'support' in name or 'pontoon' in name:
-        entity = '14' # protection
-        entity_type = '07' # engineer        
-    elif 'artillery' in name:
-        entity = '13' # fires
-        entity_type = '03'
-    elif 'army corps' in name:
-        entity = '12'
-        entity_type = '10'
-    elif 'combined arms' in name:
-        entity = '12'
-        entity_type = '10'
-    elif '[np]' in name:
-        entity = '20' # law enforcement
-        entity_type = '07'
-    elif 'border guard' in name:
-        entity = '20' # law enforcement
-        entity_type = '02'
-    elif 'rifle' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'anti-aircraft missile' in name:
-        entity = '13' # fires
-        entity_type = '01'
-    elif 'anti-aircraft' in name:
-        entity = '13' # fires
-        entity_type = '01'
-    elif '[ng]' in name: # or is movement->infantry better?
-        entity = '14' # protection
-        entity_type = '17' # security
-    elif 'omon' in name: # or is movement->infantry better?
-        entity = '14' # protection
-        # entity_type = '17' # security -# we use custom text
-    elif 'bars' in name:
-        entity = '12'
-        # entity_type = '11' # we use custom text
-    elif 'territorial defense brigade' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'tdf' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'airborne' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'mountain assault' in name:
-        entity = '12'
-        entity_type = '02'
-    elif 'motorized' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'cbrn' in name:
-        entity = '14' # protection
-        entity_type = '01'
-    elif 'nbc' in name:
-        entity = '14' # protection
-        entity_type = '01'
-    elif '[territorial]' in name:
-        entity = '12'
-        entity_type = '11'
-    elif '[pmc]' in name or 'pmc' in name:
-        entity = '12'
-        # entity_type = '11' # we use custom text
-    elif '[vol]' in name or 'volunteer' in name:
-        entity = '12'
-        # entity_type = '11' # we use custom text
-    elif 'signal' in name:
-        entity = '11' # command & control
-        entity_type = '10' # signal
-    elif 'railway' in name:
-        entity = '16' # sustainment
-        entity_type = '36' # transportation
-    elif 'logistics' in name or 'logistic' in name:
-        entity = '16' # sustainment
-        entity_type = '02' # all classes of supply
-    elif 'reconnaissance' in name or 'reconnaisse' in name or 'recon' in name:
-        entity = '12'
-        entity_type = '13'
-    elif 'electronic warfare' in name:
-        entity = '15' # intelligence
-        entity_type = '05' # electronic warfare
-    elif 'communications' in name:
-        entity = '11' # command & control
-        entity_type = '10' # signal
-    elif 'spetsnaz' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'marine' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'jager' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'combined' in name:
-        entity = '12'
-        entity_type = '10'
-    elif '[dpr]' in name or '[lpr]' in name:
-        entity = '12'
-        entity_type = '11'
-    elif 'wagner group' in name:
-        entity = '12'
-        entity_type = '10'
-    elif 'special purpose' in name: # not ideal
-        entity = '12'
-        entity_type = '17' # special forces
-    elif 'regiment' in name: # should be last, as a catch all
-        entity = '12'
-        entity_type = '11'
-    elif 'battalion' in name: # should be last, as a catch all
-        entity = '12'
-        entity_type = '11'
-    elif "assault":
-        entity = '12'
-        entity_type = '11'
-    elif "airmobile":
-        entity = '12'
-        entity_type = '11'
-    elif "coastal defense":
-        entity = '12'
-        entity_type = '11'
-    elif "guard":
-        entity = '12'
-        entity_type = '11'
-    elif "support":
-        entity = '14'
-        entity_type = '07'
-    elif "pontoon":
-        entity = '14'
-        entity_type = '07'
-
     # a few quick cases to set the entity_subtype
     if entity == '12' and entity_type == '11':
-        if 'motorized' in name:
-            entity_subtype = '04'
-        elif 'mechanized' in name:
-            entity_subtype = '02'
-        # elif 'assault' in name:
-        #     entity_subtype = '02'
-        elif 'coastal defense' in name:
-            entity_subtype = '05'
-
-    # a few quick cases to set modifier1
-    if 'marine' in name or 'naval' in name:
-        modifier1 = '46' # naval
-    
-    # modifier2
-    if 'mountain' in name:
-        modifier2 = '27'
-    elif 'airmobile' in name or 'air asault' in name:
-        modifier2 = '01'        
-
-    # if entity_type == '00' and 'corps' not in name:
-    #     print(name)
-
-    set_b = (entity, entity_type, entity_subtype, modifier1, modifier2)
-    # print(f'{name} -> {set_b}')
-    return set_b
-
-def _get_custom_text(name):
-    custom_text = ''
-    exceptions = {
-        'bars': 'BARS',
-        '[omon]': 'OMON',
-        'omon': 'OMON',
-        '[pmc]': 'PMC',
-        'pmc': 'PMC',
-        'wagner group': 'PMC',
-        '[vol]': 'VOL',
-        'volunteer': 'VOL'
-    }
-    for checkword, txt in exceptions.items():
-        if checkword in name:
-            custom_text = txt
-            break
+        entity_subtype = LAND_UNIT_INFANTRY_SUBTYPE_RULES.first(hits, '00')
+    modifier1 = LAND_UNIT_MODIFIER1_RULES.first(hits, '00')
+    modifier2 = LAND_UNIT_MODIFIER2_RULES.first(hits, '00')
+    return (entity, entity_type, entity_subtype, modifier1, modifier2)
 
-    return custom_text
 
-def _get_status(name):
-    status = 0
-    destroyed = ['Moskva', 'Ondatra', 'Ivanovets', 'Minsk', 'Rostov na Donu', 'Cesar Kunikov', 'Novocherkassk', 'Sergey Kotov', 'Askold', 'Saratov', 'A-50 AEWC RF-93966 / 37 Red', 'A-50U AEWC RF-50610 / 42-Red']
+def _get_custom_text(hits):
+    return CUSTOM_TEXT_RULES.first(hits, '')
 
-    for checkword in destroyed:
-        if checkword.lower() in name:
-            status = 4
 
-    return status
+def _get_status(hits):
+    return STATUS_RULES.first(hits, 0)
@@ -0,0 +1,62 @@
+import numpy as np
+
+# geometry simplification (douglas-peucker) for the lod levels
+# tolerances are in degrees, like the coordinates.
+# rings stay closed rings, rings which would collapse below a triangle
+# are smaller than the tolerance and dropped for that level
+
+
+def _distances(points, start, end):
+    # distance of every point to the segment start-end
+    segment = end - start
+    length = np.dot(segment, segment)
+    if length == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip((points - start) @ segment / length, 0, 1)
+    projection = start + t[:, None] * segment
+    return np.hypot(*(points - projection).T)
+
+
+def douglas_peucker(points, tolerance):
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    n = len(points)
+    if n < 3:
+        return points
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        (start, end) = stack.pop()
+        if end - start < 2:
+            continue
+        distances = _distances(points[start + 1:end], points[start], points[end])
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            i += start + 1
+            keep[i] = True
+            stack.append((start, i))
+            stack.append((i, end))
+    return points[keep]
+
+
+def simplify_line(points, tolerance):
+    return douglas_peucker(points, tolerance)
+
+
+def simplify_ring(points, tolerance):
+    # None if the ring collapses
+    ring = douglas_peucker(points, tolerance)
+    if len(ring) < 4:
+        return None
+    return ring
+
+
+def simplify_day(day, tolerance):
+    # frontline & areas of a day at one level of detail
+    lod = {
+        'frontline': [simplify_line(line, tolerance) for line in day['frontline']]
+    }
+    for key in ['areas', 'areas_ua']:
+        rings = (simplify_ring(ring, tolerance) for ring in day[key])
+        lod[key] = [ring for ring in rings if ring is not None]
+    return lod
@@ -0,0 +1,121 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+# compact in-memory representation of a day
+# Rings holds a list of (n, 2) geometries in a single float buffer plus the
+# point offset of each geometry. Snapshot holds the units of a side as an
+# id array and a (n, 2) lon, lat array, and the frontline & areas as Rings.
+# a Snapshot reads like the day dict it replaces: day['units'] builds the
+# [[id, [lon, lat]], ...] lists on access, json.dumps (with
+# geo.json_default) writes the very same json
+
+KEYS = ['unit_count', 'units', 'frontline', 'areas', 'areas_ua', 'geos', 'grid']
+
+
+class Rings:
+    __slots__ = ('coords', 'offsets')
+
+    def __init__(self, coords=None, offsets=None):
+        self.coords = np.empty((0, 2)) if coords is None else coords
+        self.offsets = np.zeros(1, dtype=np.int64) if offsets is None else offsets
+
+    @classmethod
+    def from_list(cls, geometries):
+        arrays = [np.asarray(geometry, dtype=np.float64).reshape(-1, 2) for geometry in geometries]
+        offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in arrays], out=offsets[1:])
+        coords = np.concatenate(arrays) if arrays else np.empty((0, 2))
+        return cls(coords, offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        i = range(len(self))[i]
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        for (start, end) in zip(offsets[:-1], offsets[1:]):
+            yield self.coords[start:end]
+
+    def tolist(self):
+        coords = self.coords.tolist()
+        offsets = self.offsets.tolist()
+        return [coords[start:end] for (start, end) in zip(offsets[:-1], offsets[1:])]
+
+
+def rings(geometries):
+    if isinstance(geometries, Rings):
+        return geometries
+    return Rings.from_list(geometries)
+
+
+def unit_arrays(ids, coords):
+    return (np.asarray(ids, dtype=np.int64),
+            np.asarray(coords, dtype=np.float64).reshape(-1, 2))
+
+
+class Snapshot(Mapping):
+    __slots__ = ('unit_count', 'units_by_side', 'frontline', 'areas', 'areas_ua', 'geos', 'grid')
+
+    def __init__(self):
+        self.unit_count = {
+            'ru': 0,
+            'ua': 0
+        }
+        # side -> (ids, coords)
+        self.units_by_side = {
+            'ru': unit_arrays([], []),
+            'ua': unit_arrays([], [])
+        }
+        self.frontline = Rings()
+        self.areas = Rings()
+        self.areas_ua = Rings()
+        self.geos = []
+        # only set if the day gets a spatial index
+        self.grid = None
+
+    def units(self):
+        return {side: [[unit_id, lonlat] for (unit_id, lonlat) in zip(ids.tolist(), coords.tolist())]
+                for (side, (ids, coords)) in self.units_by_side.items()}
+
+    def set_units(self, units):
+        # {side: [[id, [lon, lat]], ...]}
+        self.units_by_side = {side: unit_arrays([unit_id for (unit_id, _) in side_units],
+                                                [lonlat for (_, lonlat) in side_units])
+                              for (side, side_units) in units.items()}
+
+    def __getitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key == 'units':
+            return self.units()
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in KEYS:
+            raise KeyError(key)
+        if key == 'units':
+            self.set_units(value)
+        else:
+            setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in KEYS and (key != 'grid' or self.grid is not None)
+
+    def __iter__(self):
+        return (key for key in KEYS if key in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        day = Snapshot.__new__(Snapshot)
+        for key in Snapshot.__slots__:
+            setattr(day, key, getattr(self, key))
+        return day
+
+    def to_dict(self):
+        return {key: self[key] for key in self}
@@ -0,0 +1,89 @@
+import json
+
+import numpy as np
+
+import output
+
+# per day statistics as a columnar time series
+#   {'dates': [...], '<column>': [value per date, ...], ...}
+# days without any data are null. areas are in km², on a spherical earth
+# (spherical shoelace formula), lengths in km (haversine)
+
+EARTH_RADIUS = 6371.0088
+
+COLUMNS = [
+    'area_ru_km2',
+    'area_ua_km2',
+    'area_ru_change_km2',
+    'area_ua_change_km2',
+    'frontline_km',
+    'units_ru',
+    'units_ua'
+]
+
+
+def ring_area(ring):
+    # km², ring is a (n, 2) lat, lon array (closed or not)
+    ring = np.radians(np.asarray(ring, dtype=np.float64).reshape(-1, 2))
+    if len(ring) < 3:
+        return 0.0
+    lat = ring[:, 0]
+    lon = ring[:, 1]
+    # sum of (lon[i + 1] - lon[i - 1]) * sin(lat[i])
+    area = np.sum((np.roll(lon, -1) - np.roll(lon, 1)) * np.sin(lat))
+    return float(abs(area) * EARTH_RADIUS ** 2 / 2)
+
+
+def line_length(line):
+    # km, line is a (n, 2) lat, lon array
+    line = np.radians(np.asarray(line, dtype=np.float64).reshape(-1, 2))
+    if len(line) < 2:
+        return 0.0
+    (lat1, lon1) = line[:-1].T
+    (lat2, lon2) = line[1:].T
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return float(np.sum(2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))))
+
+
+def day_stats(day):
+    unit_count = day['unit_count']
+    if not (day['areas'] or day['areas_ua'] or day['frontline'] or unit_count['ru'] or unit_count['ua']):
+        return None
+    return {
+        'area_ru_km2': round(sum((ring_area(ring) for ring in day['areas']), 0.0), 3),
+        'area_ua_km2': round(sum((ring_area(ring) for ring in day['areas_ua']), 0.0), 3),
+        'frontline_km': round(sum((line_length(line) for line in day['frontline']), 0.0), 3),
+        'units_ru': unit_count['ru'],
+        'units_ua': unit_count['ua']
+    }
+
+
+def _change(values):
+    # day over day change, null if either day has no data
+    change = [None]
+    for (prev, cur) in zip(values[:-1], values[1:]):
+        change.append(None if prev is None or cur is None else round(cur - prev, 3))
+    return change
+
+
+def write(file_name, dates, timeline, encodings=()):
+    # recomputes the days of the timeline, all others are kept
+    try:
+        with open(file_name, encoding='utf-8') as fh:
+            old = json.load(fh)
+    except FileNotFoundError:
+        old = {'dates': []}
+    rows = {}
+    for (i, date_key) in enumerate(old['dates']):
+        row = {column: old[column][i] for column in COLUMNS if column in old}
+        rows[date_key] = row if row.get('units_ru') is not None else None
+    for (date_key, day) in timeline.items():
+        rows[date_key] = day_stats(day)
+
+    series = {'dates': dates}
+    for column in ['area_ru_km2', 'area_ua_km2', 'frontline_km', 'units_ru', 'units_ua']:
+        series[column] = [(rows.get(date_key) or {}).get(column) for date_key in dates]
+    series['area_ru_change_km2'] = _change(series['area_ru_km2'])
+    series['area_ua_change_km2'] = _change(series['area_ua_km2'])
+    output.write_json(file_name, series, encodings)
+    return series
@@ -0,0 +1,337 @@
+import hashlib
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+import output
+import simplify
+
+# vector tiles (mapbox vector tile 2.1, protobuf encoded)
+# every day is cut into z/x/y tiles with the layers
+# + areas, areas_ua: polygons
+# + frontline: lines
+# + units: points with the unit id & side
+# fortifications & dragon_teeth only come with the base data and are
+# tiled once. geometries are simplified per zoom level (in tile units),
+# then clipped to the tile (plus a small buffer).
+#
+# tiles are deduplicated across days: <tiles_dir>/t/<hash>.mvt holds the
+# tile content and <tiles_dir>/<date>.json (or base.json) maps 'z/x/y'
+# to the hash of the tile to fetch. tiles without any feature are left out
+
+EXTENT = 4096
+BUFFER = 64
+# douglas-peucker tolerance, in tile units
+TOLERANCE = 8
+
+# geometry types
+POINT = 1
+LINESTRING = 2
+POLYGON = 3
+
+
+# protobuf encoding
+
+def _varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+
+def _key(number, wire_type):
+    return _varint((number << 3) | wire_type)
+
+
+def _uint_field(number, value):
+    return _key(number, 0) + _varint(value)
+
+
+def _bytes_field(number, data):
+    return _key(number, 2) + _varint(len(data)) + data
+
+
+def _packed_field(number, values):
+    return _bytes_field(number, b''.join(_varint(v) for v in values))
+
+
+def _value(value):
+    if isinstance(value, str):
+        return _bytes_field(1, value.encode('utf-8'))
+    if value >= 0:
+        return _uint_field(5, value)
+    return _uint_field(6, _zigzag(value))
+
+
+def _command(command, count):
+    return (command & 0x7) | (count << 3)
+
+
+def _geometry(geom_type, parts):
+    # parts: (n, 2) int arrays in tile coordinates
+    commands = []
+    (x, y) = (0, 0)
+    for part in parts:
+        if geom_type == POLYGON:
+            part = part[:-1]  # the closing point is implicit
+        deltas = np.diff(part, axis=0, prepend=[[x, y]])
+        (x, y) = part[-1].tolist()
+        commands.append(_command(1, 1))
+        commands.extend(_zigzag(int(v)) for v in deltas[0])
+        if len(part) > 1:
+            commands.append(_command(2, len(part) - 1))
+            commands.extend(_zigzag(int(v)) for v in deltas[1:].ravel())
+        if geom_type == POLYGON:
+            commands.append(_command(7, 1))
+    return commands
+
+
+def encode_layer(name, features):
+    # features: (geom_type, parts, properties)
+    keys = {}
+    values = {}
+    encoded_features = []
+    for (geom_type, parts, properties) in features:
+        tags = []
+        for (key, value) in properties.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        feature = b''
+        if tags:
+            feature += _packed_field(2, tags)
+        feature += _uint_field(3, geom_type)
+        feature += _packed_field(4, _geometry(geom_type, parts))
+        encoded_features.append(feature)
+    layer = _uint_field(15, 2) + _bytes_field(1, name.encode('utf-8'))
+    for feature in encoded_features:
+        layer += _bytes_field(2, feature)
+    for key in keys:
+        layer += _bytes_field(3, key.encode('utf-8'))
+    for (_, value) in values:
+        layer += _bytes_field(4, _value(value))
+    layer += _uint_field(5, EXTENT)
+    return layer
+
+
+def encode_tile(layers):
+    return b''.join(_bytes_field(3, encode_layer(name, features))
+                    for (name, features) in layers.items() if features)
+
+
+# projection & clipping
+
+def project(lonlat, zoom):
+    # lon, lat -> web mercator, in tile units of this zoom level
+    lonlat = np.asarray(lonlat, dtype=np.float64).reshape(-1, 2)
+    size = EXTENT * 2 ** zoom
+    lat = np.radians(np.clip(lonlat[:, 1], -85.0511, 85.0511))
+    x = (lonlat[:, 0] + 180) / 360 * size
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * size
+    return np.column_stack((x, y))
+
+
+def _clip_ring_axis(points, axis, value, keep_greater):
+    # one sutherland-hodgman pass, the ring is implicitly closed
+    if len(points) == 0:
+        return points
+    a = points
+    b = np.roll(points, -1, axis=0)
+    inside_a = a[:, axis] >= value if keep_greater else a[:, axis] <= value
+    inside_b = np.roll(inside_a, -1)
+    # edges not crossing the line give nan/inf here, they are masked out below
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (value - a[:, axis]) / (b[:, axis] - a[:, axis])
+        cross = a + t[:, None] * (b - a)
+    cross[:, axis] = value
+    # every edge a -> b adds the crossing point (if any), then b (if inside)
+    candidates = np.stack((cross, b), axis=1)
+    mask = np.column_stack((inside_a != inside_b, inside_b))
+    return candidates[mask]
+
+
+def clip_ring(ring, bounds):
+    (xmin, ymin, xmax, ymax) = bounds
+    points = ring[:-1] if len(ring) > 1 and np.array_equal(ring[0], ring[-1]) else ring
+    for (axis, value, keep_greater) in [(0, xmin, True), (0, xmax, False),
+                                        (1, ymin, True), (1, ymax, False)]:
+        points = _clip_ring_axis(points, axis, value, keep_greater)
+    if len(points) < 3:
+        return None
+    return np.vstack((points, points[:1]))
+
+
+def clip_line(line, bounds):
+    # liang-barsky for every segment, visible parts are joined again
+    (xmin, ymin, xmax, ymax) = bounds
+    if len(line) < 2:
+        return []
+    a = line[:-1]
+    d = line[1:] - a
+    t0 = np.zeros(len(a))
+    t1 = np.ones(len(a))
+    rejected = np.zeros(len(a), dtype=bool)
+    for (p, q) in [(-d[:, 0], a[:, 0] - xmin), (d[:, 0], xmax - a[:, 0]),
+                   (-d[:, 1], a[:, 1] - ymin), (d[:, 1], ymax - a[:, 1])]:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = q / p
+        rejected |= (p == 0) & (q < 0)
+        t0 = np.where(p < 0, np.maximum(t0, r), t0)
+        t1 = np.where(p > 0, np.minimum(t1, r), t1)
+    visible = ~rejected & (t0 <= t1)
+
+    parts = []
+    current = None
+    last = None
+    for i in np.flatnonzero(visible):
+        start = a[i] + t0[i] * d[i]
+        end = a[i] + t1[i] * d[i]
+        if current is not None and last == i - 1 and t0[i] == 0 and t1[i - 1] == 1:
+            current.append(end)
+        else:
+            current = [start, end]
+            parts.append(current)
+        last = i
+    return [np.array(part) for part in parts]
+
+
+def _tile_range(points, zoom):
+    # tiles touched by the bounding box of points (incl. the buffer)
+    count = 2 ** zoom
+    (xmin, ymin) = points.min(axis=0)
+    (xmax, ymax) = points.max(axis=0)
+    x0 = max(int((xmin - BUFFER) // EXTENT), 0)
+    y0 = max(int((ymin - BUFFER) // EXTENT), 0)
+    x1 = min(int((xmax + BUFFER) // EXTENT), count - 1)
+    y1 = min(int((ymax + BUFFER) // EXTENT), count - 1)
+    return ((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+
+def _local(points, x, y):
+    # world -> integer tile coordinates, without repeated points
+    local = np.round(points - [x * EXTENT, y * EXTENT]).astype(np.int64)
+    if len(local) > 1:
+        keep = np.ones(len(local), dtype=bool)
+        keep[1:] = np.any(local[1:] != local[:-1], axis=1)
+        local = local[keep]
+    return local
+
+
+def _bounds(x, y):
+    return (x * EXTENT - BUFFER, y * EXTENT - BUFFER,
+            (x + 1) * EXTENT + BUFFER, (y + 1) * EXTENT + BUFFER)
+
+
+def _add_polygons(tiles, layer, rings, zoom):
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+        if len(ring) < 4:
+            continue
+        world = simplify.simplify_ring(project(ring[:, ::-1], zoom), TOLERANCE)
+        if world is None:
+            continue
+        for (x, y) in _tile_range(world, zoom):
+            clipped = clip_ring(world, _bounds(x, y))
+            if clipped is None:
+                continue
+            local = _local(clipped, x, y)
+            if len(local) < 4:
+                continue
+            # exterior rings have a positive area in tile coordinates (y down)
+            area = np.sum(local[:-1, 0] * local[1:, 1] - local[1:, 0] * local[:-1, 1])
+            if area == 0:
+                continue
+            if area < 0:
+                local = local[::-1]
+            tiles.setdefault((zoom, x, y), {}).setdefault(layer, []).append(
+                (POLYGON, [local], {}))
+
+
+def _add_lines(tiles, layer, lines, zoom):
+    for line in lines:
+        line = np.asarray(line, dtype=np.float64).reshape(-1, 2)
+        if len(line) < 2:
+            continue
+        world = simplify.simplify_line(project(line[:, ::-1], zoom), TOLERANCE)
+        for (x, y) in _tile_range(world, zoom):
+            parts = [_local(part, x, y) for part in clip_line(world, _bounds(x, y))]
+            parts = [part for part in parts if len(part) > 1]
+            if parts:
+                tiles.setdefault((zoom, x, y), {}).setdefault(layer, []).append(
+                    (LINESTRING, parts, {}))
+
+
+def _add_units(tiles, units, zoom):
+    for (side, side_units) in units.items():
+        if not side_units:
+            continue
+        world = project([lonlat for (_, lonlat) in side_units], zoom)
+        tile_xy = np.floor(world / EXTENT).astype(np.int64)
+        for ((unit_id, _), point, (x, y)) in zip(side_units, world, tile_xy.tolist()):
+            local = _local(point[None, :], x, y)
+            tiles.setdefault((zoom, x, y), {}).setdefault('units', []).append(
+                (POINT, [local], {'id': int(unit_id), 'side': side}))
+
+
+def tile_day(day, zooms):
+    # {(z, x, y): tile bytes}
+    tiles = {}
+    for zoom in zooms:
+        for key in ['areas', 'areas_ua']:
+            _add_polygons(tiles, key, day.get(key, []), zoom)
+        for key in ['frontline', 'fortifications', 'dragon_teeth']:
+            _add_lines(tiles, key, day.get(key, []), zoom)
+        _add_units(tiles, day.get('units', {}), zoom)
+    return {tile: encode_tile(layers) for (tile, layers) in tiles.items()}
+
+
+def write_day(tiles_dir, name, day, zooms, encodings=()):
+    # writes the tiles of a day (or of the base data) and its index
+    index = {}
+    for ((z, x, y), data) in tile_day(day, zooms).items():
+        tile_hash = hashlib.sha1(data).hexdigest()[:16]
+        file_name = os.path.join(tiles_dir, 't', f'{tile_hash}.mvt')
+        # content addressed, an existing tile never changes
+        if not os.path.exists(file_name):
+            output.write_bytes(file_name, data, encodings)
+        index[f'{z}/{x}/{y}'] = tile_hash
+    output.write_json(os.path.join(tiles_dir, f'{name}.json'), index, encodings)
+    return len(index)
+
+
+def write_days(tiles_dir, days, zooms, encodings=(), workers=1):
+    # days: {name: day}, tiled in a process pool
+    os.makedirs(os.path.join(tiles_dir, 't'), exist_ok=True)
+    names = list(days)
+    if workers <= 1 or len(names) < 2:
+        return sum(write_day(tiles_dir, name, days[name], zooms, encodings) for name in names)
+    # not forked, the caller may be running threads
+    with ProcessPoolExecutor(max_workers=min(workers, len(names)),
+                             mp_context=multiprocessing.get_context('forkserver')) as executor:
+        counts = executor.map(write_day, repeat(tiles_dir), names,
+                              (days[name] for name in names), repeat(zooms), repeat(encodings))
+        return sum(counts)
+
+
+def parse_zooms(value):
+    # '4-8' or '4,6,8' -> [4, 5, 6, 7, 8] / [4, 6, 8]
+    zooms = set()
+    for part in (value or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            (start, end) = part.split('-')
+            zooms.update(range(int(start), int(end) + 1))
+        else:
+            zooms.add(int(part))
+    return sorted(zooms)
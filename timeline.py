@@ -0,0 +1,216 @@
+import hashlib
+import json
+import os
+from collections import Counter
+
+import geo
+import output
+
+# delta encoded timeline
+# every `interval` days a full keyframe is written, the days in between
+# only hold what changed compared to the previous day:
+# + units: added, removed & moved units per side
+# + frontline & areas: the hashes of all polygons (in order) and only
+#   the polygons which are new, unchanged lists are left out entirely
+# read_day() rebuilds the full data of any day.
+# units of a rebuilt day are sorted by id, everything else keeps its order
+
+POLYGON_KEYS = ['frontline', 'areas', 'areas_ua']
+
+
+def polygon_hash(polygon):
+    polygon_json = json.dumps(polygon, default=geo.json_default, separators=(',', ':'))
+    return hashlib.sha1(polygon_json.encode()).hexdigest()[:16]
+
+
+def _unit_entries(units):
+    # hashable (id, (lon, lat)) entries
+    return [(unit_id, tuple(lonlat)) for (unit_id, lonlat) in units]
+
+
+def _sorted_units(entries):
+    return [[unit_id, list(lonlat)] for (unit_id, lonlat) in sorted(entries)]
+
+
+def diff_units(prev, cur):
+    prev_entries = Counter(_unit_entries(prev))
+    cur_entries = Counter(_unit_entries(cur))
+    removed = prev_entries - cur_entries
+    added = cur_entries - prev_entries
+
+    # a unit which is there once on both days, but at another
+    # position, is a move. ids can show up more than once a day
+    # (same name twice), those stay as remove & add
+    prev_ids = Counter(unit_id for (unit_id, _) in prev_entries.elements())
+    cur_ids = Counter(unit_id for (unit_id, _) in cur_entries.elements())
+    removed_ids = Counter(unit_id for (unit_id, _) in removed.elements())
+    added_ids = Counter(unit_id for (unit_id, _) in added.elements())
+    moved = []
+    for (unit_id, lonlat) in sorted(added.elements()):
+        if prev_ids[unit_id] == 1 and cur_ids[unit_id] == 1 \
+                and removed_ids[unit_id] == 1 and added_ids[unit_id] == 1:
+            moved.append([unit_id, list(lonlat)])
+    moved_ids = {unit_id for (unit_id, _) in moved}
+
+    diff = {}
+    if moved:
+        diff['mov'] = moved
+    add = _sorted_units(x for x in added.elements() if x[0] not in moved_ids)
+    if add:
+        diff['add'] = add
+    rem = _sorted_units(x for x in removed.elements() if x[0] not in moved_ids)
+    if rem:
+        diff['del'] = rem
+    return diff
+
+
+def apply_units(prev, diff):
+    entries = Counter(_unit_entries(prev))
+    entries.subtract(Counter(_unit_entries(diff.get('del', []))))
+    moved = {unit_id: tuple(lonlat) for (unit_id, lonlat) in diff.get('mov', [])}
+    result = []
+    for (unit_id, lonlat) in entries.elements():
+        result.append((unit_id, moved.get(unit_id, lonlat)))
+    result.extend(_unit_entries(diff.get('add', [])))
+    return _sorted_units(result)
+
+
+def _hashes(day):
+    return {key: [polygon_hash(polygon) for polygon in day.get(key, [])]
+            for key in POLYGON_KEYS}
+
+
+def diff_polygons(prev_hashes, hashes, polygons):
+    # None if nothing changed, otherwise the new order of hashes
+    # and the polygons we did not know yet
+    if hashes == prev_hashes:
+        return None
+    known = set(prev_hashes)
+    new = {}
+    for (h, polygon) in zip(hashes, polygons):
+        if h not in known:
+            new[h] = polygon
+    return {'h': hashes, 'new': new}
+
+
+def keyframe(day):
+    frame = dict(day)
+    frame['k'] = 1
+    frame['units'] = {side: _sorted_units(_unit_entries(units))
+                      for (side, units) in day['units'].items()}
+    return frame
+
+
+def delta(prev_date_key, prev_day, day, hashes=None):
+    # `hashes` are the polygon hashes of prev_day, they are
+    # replaced with the ones of day, to be reused for the next one
+    if hashes is None:
+        hashes = _hashes(prev_day)
+    frame = {
+        'p': prev_date_key,
+        'unit_count': day['unit_count'],
+        'units': {side: diff_units(prev_day['units'].get(side, []), units)
+                  for (side, units) in day['units'].items()}
+    }
+    for key in POLYGON_KEYS:
+        polygons = day.get(key, [])
+        cur_hashes = [polygon_hash(polygon) for polygon in polygons]
+        polygon_diff = diff_polygons(hashes[key], cur_hashes, polygons)
+        if polygon_diff is not None:
+            frame[key] = polygon_diff
+        hashes[key] = cur_hashes
+    # geolocations are not repeated from day to day anyway,
+    # the spatial grid (if any) is rebuilt every day as well
+    if day.get('geos'):
+        frame['geos'] = day['geos']
+    if 'grid' in day:
+        frame['grid'] = day['grid']
+    return frame
+
+
+def apply_delta(prev_day, frame, hashes=None):
+    # same as in delta(), `hashes` are updated in place
+    if hashes is None:
+        hashes = _hashes(prev_day)
+    day = {
+        'unit_count': frame['unit_count'],
+        'units': {side: apply_units(prev_day['units'].get(side, []), diff)
+                  for (side, diff) in frame['units'].items()},
+        'geos': frame.get('geos', [])
+    }
+    if 'grid' in frame:
+        day['grid'] = frame['grid']
+    for key in POLYGON_KEYS:
+        if key not in frame:
+            day[key] = prev_day.get(key, [])
+            continue
+        polygons = dict(zip(hashes[key], prev_day.get(key, [])))
+        polygons.update(frame[key]['new'])
+        day[key] = [polygons[h] for h in frame[key]['h']]
+        hashes[key] = frame[key]['h']
+    return day
+
+
+def _frame_file(data_dir, date_key):
+    return os.path.join(data_dir, f'{date_key}.json')
+
+
+def read_frame(data_dir, date_key):
+    with open(_frame_file(data_dir, date_key), encoding='utf-8') as fh:
+        return json.load(fh)
+
+
+def read_day(data_dir, date_key):
+    # walk back to the last keyframe, then replay the deltas
+    frames = []
+    while True:
+        frame = read_frame(data_dir, date_key)
+        frames.append(frame)
+        if frame.get('k'):
+            break
+        date_key = frame['p']
+    day = frames.pop()
+    del day['k']
+    hashes = _hashes(day)
+    while frames:
+        day = apply_delta(day, frames.pop(), hashes)
+    return day
+
+
+def write(data_dir, dates, timeline, interval, encodings=(), workers=1):
+    # writes the days of the timeline, `dates` is the full date range
+    # and decides which days are keyframes
+    os.makedirs(data_dir, exist_ok=True)
+    jobs = []
+    positions = {date_key: position for (position, date_key) in enumerate(dates)}
+    prev_date_key = None
+    prev_day = None
+    hashes = None
+    for date_key in sorted(timeline, key=positions.get):
+        day = timeline[date_key]
+        position = positions[date_key]
+        if position % interval == 0:
+            frame = keyframe(day)
+            hashes = None
+        else:
+            expected_prev = dates[position - 1]
+            if prev_date_key != expected_prev:
+                # the previous day was written by an earlier run
+                prev_day = read_day(data_dir, expected_prev)
+                hashes = None
+            if hashes is None:
+                hashes = _hashes(prev_day)
+            frame = delta(expected_prev, prev_day, day, hashes)
+        jobs.append((_frame_file(data_dir, date_key), frame, encodings))
+        prev_date_key = date_key
+        prev_day = day
+    # the frames only depend on the days in memory and the files
+    # before them, so they can be written in any order
+    return output.write_many(jobs, workers)
+
+
+if __name__ == '__main__':
+    # rebuild a single day: python timeline.py <date> [data dir]
+    import sys
+    data_dir = sys.argv[2] if len(sys.argv) > 2 else './data/delta'
+    print(json.dumps(read_day(data_dir, sys.argv[1]), separators=(',', ':')))
@@ -0,0 +1,75 @@
+import json
+import os
+
+import output
+
+# per unit trajectories
+# <trajectory_dir>/<shard>.json maps the unit ids id // shard_size == shard
+# to their time ordered positions: {id: [[date index, lon, lat], ...]},
+# the date index points into the 'dates' list of base.json.
+# index.json holds the shard size & the date index range of every shard,
+# so an update only has to rewrite the shards with new or redone days
+
+
+def _read_json(file_name, default):
+    try:
+        with open(file_name, encoding='utf-8') as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return default
+
+
+def write(trajectory_dir, dates, timeline, shard_size=64, encodings=()):
+    # timeline: the days of this run, they replace whatever the
+    # trajectories had for these dates so far
+    os.makedirs(trajectory_dir, exist_ok=True)
+    index_file = os.path.join(trajectory_dir, 'index.json')
+    index = _read_json(index_file, {})
+    if index.get('shard_size') != shard_size:
+        # no (usable) index, start over
+        index = {'shard_size': shard_size, 'shards': {}}
+
+    positions = {date_key: position for (position, date_key) in enumerate(dates)}
+    changed = {positions[date_key] for date_key in timeline}
+    if not changed:
+        return 0
+
+    new = {}
+    for date_key in timeline:
+        position = positions[date_key]
+        for units in timeline[date_key]['units'].values():
+            for (unit_id, (lon, lat)) in units:
+                shard = str(unit_id // shard_size)
+                new.setdefault(shard, {}).setdefault(str(unit_id), []).append([position, lon, lat])
+
+    # shards with new positions or with positions on the dates we redo
+    first_changed = min(changed)
+    shards = set(new)
+    shards.update(shard for (shard, (_, last)) in index['shards'].items() if last >= first_changed)
+
+    for shard in sorted(shards, key=int):
+        file_name = os.path.join(trajectory_dir, f'{shard}.json')
+        trajectories = _read_json(file_name, {}) if shard in index['shards'] else {}
+        for (unit_id, track) in trajectories.items():
+            trajectories[unit_id] = [entry for entry in track if entry[0] not in changed]
+        for (unit_id, track) in new.get(shard, {}).items():
+            trajectories.setdefault(unit_id, []).extend(track)
+        trajectories = {unit_id: sorted(track, key=lambda entry: entry[0])
+                        for (unit_id, track) in trajectories.items() if track}
+        output.write_json(file_name, trajectories, encodings)
+        entries = [entry[0] for track in trajectories.values() for entry in track]
+        if entries:
+            index['shards'][shard] = [min(entries), max(entries)]
+        else:
+            index['shards'].pop(shard, None)
+
+    output.write_json(index_file, index, encodings)
+    return len(shards)
+
+
+def read(trajectory_dir, unit_id):
+    # [[date index, lon, lat], ...] of a single unit
+    index = _read_json(os.path.join(trajectory_dir, 'index.json'), {})
+    shard = unit_id // index['shard_size']
+    trajectories = _read_json(os.path.join(trajectory_dir, f'{shard}.json'), {})
+    return trajectories.get(str(unit_id), [])